@@ -1,10 +1,21 @@
+import time
+
 import pandas as pd
 import streamlit as st
 
-from collections import defaultdict
+from instrumentation import show_report
+from library_index import LibraryIndex
+from normalization import COUNTRY_MAPPER, CodeMapper
+from normalized_cache import NormalizedCache
+from parser_engine import BaseParser, register_source
+from spatial import SpatialBins
+from timestamps import parse_timestamps
+
 
+@register_source("apple")
+class AppleParser(BaseParser):
+    SCHEMA_VERSION = 10
 
-class AppleParser:
     COLUMNS = [
         'Album Name',
         'Container Album Name',
@@ -34,6 +45,21 @@ class AppleParser:
         'UTC Offset In Seconds'
     ]
 
+    # Only COLUMNS are read, with fixed dtypes so no per-chunk inference is needed
+    NUMERIC_COLUMNS = [
+        'End Position In Milliseconds',
+        'IP Latitude',
+        'IP Longitude',
+        'Media Duration In Milliseconds',
+        'Milliseconds Since Play',
+        'Play Duration Milliseconds',
+        'Start Position In Milliseconds',
+        'UTC Offset In Seconds'
+    ]
+    ACTIVITY_DTYPES = dict.fromkeys(COLUMNS, str) | dict.fromkeys(NUMERIC_COLUMNS, "float64")
+
+    CSV_CHUNKSIZE = 100_000
+
     END_REASON_DICT = {
         "EXITED_APPLICATION": "logout",
         "FAILED_TO_LOAD": "track_error",
@@ -56,17 +82,8 @@ class AppleParser:
         "SHUFFLE_UNKNOWN": "Unknown"
     }
 
-    def __constant_factory(value):
-        return lambda: value
-
-    COUNTRY_DICT = defaultdict(__constant_factory("Unknown"))
-    COUNTRY_LIST = [
-        ("GB", "United Kingdom"),
-        ("AL", "Albania"),
-        ("ES", "Spain"),
-        ("IE", "Ireland"),
-        ("US", "United States")
-    ]
+    END_REASON_MAPPER = CodeMapper(END_REASON_DICT)
+    SHUFFLE_MAPPER = CodeMapper(SHUFFLE_DICT)
 
     RENAME_COLUMNS = {
         "Album Name": "Album name",
@@ -76,73 +93,81 @@ class AppleParser:
         "IP Country Code": "Country"
     }
 
-    COLUMNS_FOR_ANALYSIS = [
-        "Datetime",
-        "Day name",
-        "Day number",
-        "Month number",
-        "Year",
-        "Hour",
-        "Artist",
-        "Album name",
-        "Song name",
-        "Song and Artist name",
-        "Genre",
-        "Platform",
-        "Milliseconds played",
-        "End reason",
-        "Shuffle",
-        "Country",
-        "Latitude",
-        "Longitude"
-    ]
-
-    def __init__(self, csv_file_path: str, identifier_file_path: str, library_tracks_file_path: str):
-        # Populate the country dictionary
-        for k, v in self.COUNTRY_LIST:
-            self.COUNTRY_DICT[k] = v
-
-        # cleaning the music activity data
-        self.music_activity_df = pd.read_csv(csv_file_path, low_memory=False)
-        self.music_activity_df.dropna(subset=['Album Name'], inplace=True)
-        self.music_activity_df.dropna(subset=['Song Name'], inplace=True)
-        self.music_activity_df = self.music_activity_df[self.music_activity_df['Media Type'] != 'VIDEO']
-        self.music_activity_df = self.music_activity_df[self.music_activity_df['Play Duration Milliseconds'] >= 0]
-        self.music_activity_df = self.music_activity_df[self.music_activity_df['Event Type'] != 'LYRIC_DISPLAY']
-        self.music_activity_df = self.music_activity_df[self.COLUMNS]
-        self.music_activity_df.replace({"Event Start Timestamp": ""}, pd.NA, inplace=True)
-        self.music_activity_df.dropna(subset=["Event Start Timestamp"], inplace=True)
-        self.music_activity_df.replace({"IP Country Code": pd.NA}, "unknown", inplace=True)
-
-        # load, read and rename two columns in library tracks data
-        self.library_tracks_df = pd.read_json(library_tracks_file_path)
-        library_rename = {"Title": "Song Name", "Album": "Album Name"}
-        self.library_tracks_df.rename(columns=library_rename, inplace=True)
-
-        # Merge the DataFrames on common columns: 'Song Name' and 'Album Name'
-        self.df = self.music_activity_df.merge(self.library_tracks_df, on=['Song Name', 'Album Name'], how="inner")
+    def __init__(self, csv_file_path: str, identifier_file_path: str, library_tracks_file_path: str,
+                 normalized_cache: NormalizedCache = None, chunksize: int = CSV_CHUNKSIZE):
+        self.library_index = None
+        self.csv_file_path = csv_file_path
+        self.library_tracks_file_path = library_tracks_file_path
+        self.chunksize = chunksize
+        super().__init__([csv_file_path, library_tracks_file_path], normalized_cache)
+
+    def _parse_base(self) -> pd.DataFrame:
+        # De-duplicated library lookup, cached between runs
+        with self.report.stage("library_index") as stage:
+            self.library_index = LibraryIndex.from_json(self.library_tracks_file_path, cache=self.normalized_cache)
+            stage["rows_out"] = len(self.library_index.entries)
+
+        # Clean the music activity data chunk by chunk and probe each chunk against the library,
+        # so only plays that survive the filters and match a library track are ever kept
+        df = self._read_activity(self.csv_file_path, self.chunksize)
+
+        # Local wall-clock time, so Hour and Day reflect when the listener actually pressed play
+        with self.report.stage("parse_timestamps", rows_in=len(df)) as stage:
+            df["Datetime"] = parse_timestamps(df["Event Start Timestamp"], df["UTC Offset In Seconds"])
+            # Timestamps that aren't real dates (e.g. 2020-02-30) parse to NaT; like blank ones, those plays are
+            # dropped, and rows_in - rows_out is how many
+            df = df[df["Datetime"].notna()].reset_index(drop=True)
+            stage["rows_out"] = len(df)
 
         # Create new columns or rename existing
-        self.df["Datetime"] = pd.to_datetime(self.df["Event Start Timestamp"], format='mixed')
-        self.df["Day name"] = self.df["Datetime"].dt.day_name()
-        self.df["Day number"] = self.df["Datetime"].dt.day
-        self.df["Month number"] = self.df["Datetime"].dt.month
-        self.df["Year"] = self.df["Datetime"].dt.year
-        self.df["Hour"] = self.df["Datetime"].dt.hour
-        self.df["Song and Artist name"] = self.df["Song Name"] + " | " + self.df["Artist"]
-        self.df["Genre"] = self.df["Genre"].apply(lambda x: [x])
-        self.df["Platform"] = self.df["Device OS Name"] + " | " + self.df["Device Type"] + " | " + self.df["Device OS Version"]
-        self.df["Milliseconds played"] = self.df["Play Duration Milliseconds"]
-        self.df.replace({"End Reason Type": self.END_REASON_DICT}, inplace=True)
-        self.df.replace({"Shuffle Play": self.SHUFFLE_DICT}, inplace=True)
-        self.df.replace({"IP Country Code": self.COUNTRY_DICT}, inplace=True)
-        self.df["Latitude"] = self.df["IP Latitude"]
-        self.df["Longitude"] = self.df["IP Longitude"]
-
-        self.df = self.df.rename(columns=self.RENAME_COLUMNS)[self.COLUMNS_FOR_ANALYSIS]
-
-    def get_dataframe(self):
-        return self.df
+        with self.report.stage("derive_columns", rows_in=len(df)) as stage:
+            # The library holds one genre per track, so the genre itself is the play's genre set
+            df["Genre set"] = df["Genre"].astype("category")
+            df["Platform"] = df["Device OS Name"] + " | " + df["Device Type"] + " | " + df["Device OS Version"]
+            df["Milliseconds played"] = df["Play Duration Milliseconds"].astype("int64")
+            df["Latitude"] = df["IP Latitude"]
+            df["Longitude"] = df["IP Longitude"]
+            stage["rows_out"] = len(df)
+
+        with self.report.stage("map_codes", rows_in=len(df)) as stage:
+            df["End Reason Type"] = self.END_REASON_MAPPER.map(df["End Reason Type"])
+            df["Shuffle Play"] = self.SHUFFLE_MAPPER.map(df["Shuffle Play"])
+            df["IP Country Code"] = COUNTRY_MAPPER.map(df["IP Country Code"])
+            stage["rows_out"] = len(df)
+        return df.rename(columns=self.RENAME_COLUMNS)
+
+    def _read_activity(self, csv_file_path: str, chunksize: int = None) -> pd.DataFrame:
+        # The filter and library join run per chunk, so their time is accumulated and reported as parts of read_activity
+        filter_seconds = join_seconds = 0.0
+        rows_read = rows_filtered = 0
+        chunks = []
+        with self.report.stage("read_activity") as stage:
+            with pd.read_csv(csv_file_path, usecols=self.COLUMNS, dtype=self.ACTIVITY_DTYPES, chunksize=chunksize or self.CSV_CHUNKSIZE) as reader:
+                for chunk in reader:
+                    rows_read += len(chunk)
+                    start = time.perf_counter()
+                    chunk = self._filter_activity_chunk(chunk)
+                    filter_seconds += time.perf_counter() - start
+                    rows_filtered += len(chunk)
+                    start = time.perf_counter()
+                    chunks.append(self.library_index.probe(chunk))
+                    join_seconds += time.perf_counter() - start
+            df = pd.concat(chunks, ignore_index=True)
+            stage.update(rows_in=rows_read, rows_out=len(df))
+        self.report.add("filter_activity", filter_seconds, rows_in=rows_read, rows_out=rows_filtered, part_of="read_activity")
+        self.report.add("library_join", join_seconds, rows_in=rows_filtered, rows_out=len(df), part_of="read_activity")
+        return df
+
+    @staticmethod
+    def _filter_activity_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+        # Empty cells are read as missing, so this also drops blank start timestamps
+        chunk = chunk.dropna(subset=['Album Name', 'Song Name', 'Event Start Timestamp'])
+        keep = (
+            (chunk['Media Type'] != 'VIDEO')
+            & (chunk['Play Duration Milliseconds'] >= 0)
+            & (chunk['Event Type'] != 'LYRIC_DISPLAY')
+        )
+        return chunk[keep]
 
 
 if __name__ == '__main__':
@@ -153,6 +178,17 @@ if __name__ == '__main__':
     )
     df = apple_parser.get_dataframe()
     st.write(df.head(50))
-
-    clean_df = df.dropna(subset=['Latitude', 'Longitude'])
-    st.map(clean_df, latitude="Latitude", longitude="Longitude")
+    # Derived columns are only built when asked for
+    st.write(apple_parser.data.materialized)
+    if apple_parser.library_index is not None:
+        st.write(apple_parser.library_index.stats)
+    show_report(apple_parser.report)
+
+    # Plays are binned server-side, so the map only ever receives a few thousand aggregated cells
+    bins = SpatialBins(df)
+    zoom = st.slider("Map detail", 1, 16, 4)
+    cells = bins.cells(zoom=zoom)
+    cells["size"] = cells["cell_radius_m"] * (cells["plays"] / cells["plays"].max()) ** 0.5
+    st.write(f"{len(bins):,} located plays in {len(cells):,} cells")
+    st.map(cells, latitude="latitude", longitude="longitude", size="size", zoom=zoom)
+    st.dataframe(cells.sort_values("hours", ascending=False).head(20))
@@ -0,0 +1,258 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from os import environ, path
+
+from instrumentation import peak_rss_mb
+
+
+SPOTIFY_PATTERN = "Streaming_History_Audio_*.json"
+APPLE_FILES = {
+    "csv_file_path": "Apple Music Play Activity.csv",
+    "identifier_file_path": "Identifier Information.json",
+    "library_tracks_file_path": "Apple Music Library Tracks.json"
+}
+SOURCES = ["spotify", "apple"]
+DEFAULT_MEMORY_LIMIT_MB = 4096
+# Workers are replaced after this many exports, so memory one export leaves fragmented is returned to the OS
+TASKS_PER_WORKER = 4
+# Times a job may kill its worker (e.g. the OOM killer) before it is failed; only counted when it ran alone
+MAX_ATTEMPTS = 2
+# Total Last.fm request rate across all workers, shared out between them
+REQUESTS_PER_SECOND = 5.0
+
+
+def find_exports(user_dir: str, sources: list = None) -> dict:
+    # Source -> parser inputs for every export found anywhere under a user's directory
+    exports = {}
+    spotify_files = sorted(glob.glob(path.join(user_dir, "**", SPOTIFY_PATTERN), recursive=True))
+    if spotify_files:
+        exports["spotify"] = {"json_file_path": spotify_files}
+    apple_files = {}
+    for argument, name in APPLE_FILES.items():
+        matches = sorted(glob.glob(path.join(user_dir, "**", name), recursive=True))
+        if matches:
+            apple_files[argument] = matches[0]
+    if len(apple_files) == len(APPLE_FILES):
+        exports["apple"] = apple_files
+    return {source: inputs for source, inputs in exports.items() if sources is None or source in sources}
+
+
+def input_files(inputs: dict) -> list:
+    files = []
+    for value in inputs.values():
+        files.extend(value if isinstance(value, list) else [value])
+    return sorted(files)
+
+
+def fingerprint(inputs: dict) -> list:
+    # Size and modification time of every input: cheap to check, and a re-exported account always changes them
+    return [[file, os.stat(file).st_size, int(os.stat(file).st_mtime)] for file in input_files(inputs)]
+
+
+def marker_path(output_dir: str, user: str, source: str) -> str:
+    return path.join(output_dir, user, "done", f"{source}.json")
+
+
+def is_done(output_dir: str, user: str, source: str, inputs: dict) -> bool:
+    # Finished, and from the same inputs; a marker is only written once every output of the export is in place
+    try:
+        with open(marker_path(output_dir, user, source)) as f:
+            return json.load(f)["inputs"] == fingerprint(inputs)
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def _write_json(file_path: str, data: dict):
+    os.makedirs(path.dirname(file_path), exist_ok=True)
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, file_path)
+
+
+def limit_memory(limit_mb: int):
+    # Runs in each worker before any job. RLIMIT_DATA caps heap and anonymous mappings but not memory-mapped cache
+    # files; platforms without it fall back to the whole address space. An allocation past the cap raises MemoryError.
+    if not limit_mb:
+        return
+    import resource
+
+    limit = getattr(resource, "RLIMIT_DATA", resource.RLIMIT_AS)
+    _, hard = resource.getrlimit(limit)
+    limit_bytes = limit_mb * 1024 * 1024
+    resource.setrlimit(limit, (limit_bytes if hard == resource.RLIM_INFINITY else min(limit_bytes, hard), hard))
+
+
+def _init_worker(limit_mb: int, started):
+    global _started
+    _started = started
+    limit_memory(limit_mb)
+
+
+def _run_export(user: str, source: str, *args) -> dict:
+    # Reported before any work, so when a worker dies the jobs that were running can be told from those still queued
+    _started.put((user, source))
+    return process_export(user, source, *args)
+
+
+def process_export(user: str, source: str, inputs: dict, output_dir: str, requests_per_second: float = REQUESTS_PER_SECOND) -> dict:
+    # Parses one export and writes its normalised plays, rollups and report, then the success marker last. Exports
+    # with failed genre lookups get no marker, so the next run redoes them.
+    from listening_sql import PLAY_COLUMNS, write_parquet
+    from parser_engine import parse
+    from rollup import RollupCube
+
+    start = time.perf_counter()
+    if source == "spotify":
+        from genre_cache import GenreCache
+        from genre_enricher import GenreEnricher
+
+        enricher = GenreEnricher(environ["LAST_FM_API_KEY"], base_url=environ.get("LAST_FM_URL"),
+                                 requests_per_second=requests_per_second, cache=GenreCache())
+        parser = parse(source, enricher=enricher, **inputs)
+    else:
+        parser = parse(source, **inputs)
+
+    user_dir = path.join(output_dir, user)
+    # plays/<source>.parquet is the layout ListeningSQL reads, so ListeningSQL(user_dir) queries a finished user
+    rows = write_parquet(parser.get_dataframe(PLAY_COLUMNS).assign(Source=source), path.join(user_dir, "plays", f"{source}.parquet"))
+    RollupCube(parser.data).save(path.join(user_dir, "rollups", source))
+    os.makedirs(path.join(user_dir, "reports"), exist_ok=True)
+    parser.report.to_json(path.join(user_dir, "reports", f"{source}.json"))
+
+    peak = peak_rss_mb()
+    result = {
+        "user": user,
+        "source": source,
+        "rows": rows,
+        "seconds": round(time.perf_counter() - start, 2),
+        "peak_rss_mb": None if peak is None else round(peak, 1),
+        "cache_hit": parser.report.cache_hit,
+        "complete": parser.complete,
+        "schema_version": parser.SCHEMA_VERSION,
+        "finished": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "inputs": fingerprint(inputs)
+    }
+    if parser.complete:
+        _write_json(marker_path(output_dir, user, source), result)
+    return result
+
+
+def find_jobs(input_dir: str, output_dir: str, sources: list = None, force: bool = False) -> tuple:
+    # Every (user, source) export under input_dir, split into jobs still to run and ones already finished
+    jobs, skipped = [], []
+    for user in sorted(os.listdir(input_dir)):
+        user_dir = path.join(input_dir, user)
+        if not path.isdir(user_dir):
+            continue
+        for source, inputs in find_exports(user_dir, sources).items():
+            if not force and is_done(output_dir, user, source, inputs):
+                skipped.append({"user": user, "source": source})
+            else:
+                jobs.append({"user": user, "source": source, "inputs": inputs})
+    return jobs, skipped
+
+
+def run_batch(input_dir: str, output_dir: str, workers: int = None, memory_limit_mb: int = DEFAULT_MEMORY_LIMIT_MB,
+              sources: list = None, force: bool = False, tasks_per_worker: int = TASKS_PER_WORKER,
+              requests_per_second: float = REQUESTS_PER_SECOND) -> dict:
+    jobs, skipped = find_jobs(input_dir, output_dir, sources, force)
+    workers = max(1, min(workers or os.cpu_count(), len(jobs) or 1))
+    print(f"{len(jobs)} export(s) to process, {len(skipped)} already done, {workers} worker(s) limited to {memory_limit_mb} MB each")
+
+    results, failures = [], []
+    attempts = {}
+    pending, suspects = jobs, []
+    while pending or suspects:
+        # A worker that dies breaks its pool, and every unfinished job fails with it. Jobs that had not started are
+        # simply resubmitted; those that were running are re-run alone, one per process, where a crash is their own.
+        isolated = not pending
+        round_jobs = suspects if isolated else pending
+        # Suspects wait while there are pending jobs, since a shared pool can't tell which job killed a worker
+        next_pending, next_suspects = [], ([] if isolated else list(suspects))
+        context = get_context("spawn")
+        started_queue = context.SimpleQueue()
+        started = set()
+        with ProcessPoolExecutor(max_workers=1 if isolated else workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(memory_limit_mb, started_queue), max_tasks_per_child=1 if isolated else tasks_per_worker) as pool:
+            futures = {
+                pool.submit(_run_export, job["user"], job["source"], job["inputs"], output_dir, requests_per_second / workers): job
+                for job in round_jobs
+            }
+            broken = []
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = futures.pop(future)
+                    label = f"{job['user']}/{job['source']}"
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        broken.append(job)
+                    except Exception as error:
+                        failures.append({"user": job["user"], "source": job["source"], "error": f"{type(error).__name__}: {error}"})
+                        print(f"  FAILED {label}: {type(error).__name__}: {error}", file=sys.stderr)
+                    else:
+                        results.append(result)
+                        note = "" if result["complete"] else " (genre lookups failed, redone next run)"
+                        peak = "?" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']:.0f}"
+                        print(f"  {label}: {result['rows']:,} plays in {result['seconds']:.1f}s, peak {peak} MB{note}")
+        while not started_queue.empty():
+            started.add(tuple(started_queue.get()))
+        # A worker that died before starting any job (e.g. a limit too low to import pandas) leaves no culprit, so
+        # every job in the pool is charged
+        culprits = [job for job in broken if (job["user"], job["source"]) in started] or broken
+        for job in broken:
+            label = f"{job['user']}/{job['source']}"
+            if job not in culprits:
+                (next_suspects if isolated else next_pending).append(job)
+            elif not isolated and len(culprits) > 1:
+                # Several jobs were running; which one killed its worker is only known once they run alone
+                next_suspects.append(job)
+            else:
+                attempts[label] = attempts.get(label, 0) + 1
+                if attempts[label] < MAX_ATTEMPTS:
+                    next_suspects.append(job)
+                    continue
+                failures.append({"user": job["user"], "source": job["source"], "error": "worker died (memory limit?)"})
+                print(f"  FAILED {label}: worker died", file=sys.stderr)
+        pending, suspects = next_pending, next_suspects
+
+    summary = {
+        "finished": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "input_dir": path.abspath(input_dir),
+        "processed": results,
+        "skipped": skipped,
+        "failed": failures
+    }
+    _write_json(path.join(output_dir, "batch_summary.json"), summary)
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Parse every user's Spotify and Apple Music exports under INPUT_DIR into OUTPUT_DIR/<user>: "
+                                                 "plays/<source>.parquet, rollups/<source>/ and reports/<source>.json. "
+                                                 "Finished exports are skipped on re-runs unless their files changed.")
+    parser.add_argument("input_dir", help="one sub-directory per user, holding that user's exports")
+    parser.add_argument("output_dir")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--memory-limit-mb", type=int, default=DEFAULT_MEMORY_LIMIT_MB, help="per worker; 0 for no limit")
+    parser.add_argument("--sources", nargs="+", choices=SOURCES, default=None)
+    parser.add_argument("--tasks-per-worker", type=int, default=TASKS_PER_WORKER)
+    parser.add_argument("--requests-per-second", type=float, default=REQUESTS_PER_SECOND, help="Last.fm rate across all workers")
+    parser.add_argument("--force", action="store_true", help="re-process exports that already finished")
+    args = parser.parse_args()
+
+    summary = run_batch(args.input_dir, args.output_dir, args.workers, args.memory_limit_mb, args.sources, args.force,
+                        args.tasks_per_worker, args.requests_per_second)
+    print(f"{len(summary['processed'])} processed, {len(summary['skipped'])} skipped, {len(summary['failed'])} failed")
+    sys.exit(1 if summary["failed"] else 0)
@@ -0,0 +1,49 @@
+import argparse
+import json
+import sys
+
+
+# Stages slower (or hungrier) than this fraction over the baseline are reported as regressions
+DEFAULT_THRESHOLD = 0.10
+
+
+def load_results(path: str) -> dict:
+    with open(path) as f:
+        report = json.load(f)
+    return {(result["source"], result["plays"]): result for result in report["results"] if "error" not in result}
+
+
+def compare(baseline_path: str, candidate_path: str, threshold: float = DEFAULT_THRESHOLD) -> list:
+    baseline = load_results(baseline_path)
+    candidate = load_results(candidate_path)
+    regressions = []
+    print(f"{'source':>8} {'plays':>11} {'stage':>10} {'seconds':>17} {'ratio':>6} {'peak MB':>15} {'ratio':>6}")
+    for key in sorted(baseline.keys() & candidate.keys()):
+        source, plays = key
+        for stage, before in baseline[key]["stages"].items():
+            after = candidate[key]["stages"].get(stage)
+            if after is None:
+                continue
+            time_ratio = after["seconds"] / before["seconds"] if before["seconds"] else float("nan")
+            # Peak memory is null in results from machines where it couldn't be measured
+            before_mb, after_mb = (float("nan") if stage_mb is None else stage_mb for stage_mb in (before["peak_rss_mb"], after["peak_rss_mb"]))
+            memory_ratio = after_mb / before_mb if before_mb else float("nan")
+            flag = ""
+            if time_ratio > 1 + threshold or memory_ratio > 1 + threshold:
+                regressions.append((source, plays, stage))
+                flag = "  <- regression"
+            print(f"{source:>8} {plays:>11,} {stage:>10} {before['seconds']:>7.2f} -> {after['seconds']:>7.2f} {time_ratio:>6.2f} "
+                  f"{before_mb:>6.0f} -> {after_mb:>6.0f} {memory_ratio:>6.2f}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files stage by stage.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    regressions = compare(args.baseline, args.candidate, args.threshold)
+    print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from instrumentation import peak_rss_mb, rss_mb
+
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+SOURCES = ["spotify", "apple"]
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+DATA_DIR = os.path.join(tempfile.gettempdir(), "music_analyser_benchmarks")
+# Simulated Last.fm round trip for the enrichment stage
+STUB_LATENCY = 0.005
+
+
+class PeakMemory:
+    # Samples resident memory in a background thread; ru_maxrss cannot be reset, so this gives a per-stage peak
+    INTERVAL = 0.01
+
+    def __init__(self):
+        self.start_mb = self.peak_mb = rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _update(self):
+        # rss_mb() is None where memory can't be measured, and then so is the peak
+        current = rss_mb()
+        if current is not None and (self.peak_mb is None or current > self.peak_mb):
+            self.peak_mb = current
+
+    def _sample(self):
+        while not self._stop.wait(self.INTERVAL):
+            self._update()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._update()
+
+
+def _round_mb(value: float) -> float:
+    return None if value is None else round(value, 1)
+
+
+def _format_mb(value: float) -> str:
+    return "?MB" if value is None else f"{value:.0f}MB"
+
+
+class StageTimer:
+    # Collects wall time, rows and peak memory for each named stage of one benchmark run
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name: str, function, *args, **kwargs):
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            seconds = time.perf_counter() - start
+        self.stages[name] = {
+            "seconds": round(seconds, 4),
+            "rows": len(result) if hasattr(result, "__len__") else None,
+            "start_rss_mb": _round_mb(memory.start_mb),
+            "peak_rss_mb": _round_mb(memory.peak_mb)
+        }
+        return result
+
+
+def aggregate(df: pd.DataFrame, labels: dict = None):
+    # The work the dashboard does after parsing: sort into a time index, build the rollups and query every chart
+    from rollup import RollupCube
+    from time_index import TimeIndex
+
+    time_index = TimeIndex(df, "Datetime")
+    cube = RollupCube(time_index.df, labels=labels)
+    start, end = cube.date_bounds()
+    for dimension in cube.dimensions:
+        cube.ranking(dimension, start, end).top(50)
+    cube.plays_per_hour()
+    cube.hours_per_day_name()
+    cube.plays_per_month()
+    cube.discoveries_per_day(start, end)
+    return cube.time.df
+
+
+def dataset(source: str, plays: int, data_dir: str, seed: int = 0):
+    # Synthetic exports are generated once per (source, size, seed) and reused by later runs
+    from benchmarks.synthetic import write_apple_export, write_spotify_export
+
+    directory = os.path.join(data_dir, f"{source}_{plays}_seed{seed}")
+    manifest = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            return json.load(f)
+    writer = write_spotify_export if source == "spotify" else write_apple_export
+    files = writer(directory, plays, seed)
+    with open(manifest, "w") as f:
+        json.dump(files, f)
+    return files
+
+
+def bench_spotify(files: list, timer: StageTimer, workdir: str):
+    from genre_cache import GenreCache
+    from genre_enricher import GenreEnricher
+    from lastfm_stub import StubLastFmServer
+    from normalized_cache import NormalizedCache
+    from parser_engine import COLUMNS_FOR_ANALYSIS, KEY_COLUMNS
+    from spotify_parser import SpotifyParser
+    from streaming_json import read_json_chunked
+
+    raw = timer.run("load", read_json_chunked, files, SpotifyParser.REQUIRED_COLUMNS)
+    raw = raw.dropna(subset=["master_metadata_track_name", "master_metadata_album_artist_name"])
+    pairs = set(zip(raw["master_metadata_album_artist_name"], raw["master_metadata_track_name"]))
+    del raw
+
+    with StubLastFmServer(latency=STUB_LATENCY) as server:
+        enricher = GenreEnricher("benchmark", base_url=server.url, max_workers=16, requests_per_second=0,
+                                 cache=GenreCache(os.path.join(workdir, "genres.sqlite")))
+        # Cold enrichment of every distinct track against the stub
+        timer.run("enrich", enricher.enrich, pairs)
+        timer.stages["enrich"]["lastfm"] = enricher.request_stats.summary()
+        # Full parse with the genre cache now warm, so this is reading plus normalisation
+        parser = timer.run("normalize", SpotifyParser, files, enricher=enricher, normalized_cache=NormalizedCache(enabled=False))
+    df = parser.get_dataframe(COLUMNS_FOR_ANALYSIS + KEY_COLUMNS)
+    timer.stages["normalize"].update(rows=len(df), report=parser.report.to_dict())
+    timer.run("aggregate", aggregate, df, parser.dimensions.labels())
+
+
+def bench_apple(files: dict, timer: StageTimer, workdir: str):
+    from apple_parser import AppleParser
+    from normalized_cache import NormalizedCache
+    from parser_engine import COLUMNS_FOR_ANALYSIS, KEY_COLUMNS
+
+    def load():
+        with pd.read_csv(files["csv_file_path"], usecols=AppleParser.COLUMNS, dtype=AppleParser.ACTIVITY_DTYPES,
+                         chunksize=AppleParser.CSV_CHUNKSIZE) as reader:
+            return pd.concat(reader, ignore_index=True)
+
+    timer.run("load", load)
+    # Apple genres come from the library file, so there is no enrichment stage; normalize includes the library join
+    parser = timer.run("normalize", AppleParser, normalized_cache=NormalizedCache(enabled=False), **files)
+    df = parser.get_dataframe(COLUMNS_FOR_ANALYSIS + KEY_COLUMNS)
+    timer.stages["normalize"].update(rows=len(df), report=parser.report.to_dict())
+    timer.run("aggregate", aggregate, df, parser.dimensions.labels())
+
+
+def run_single(source: str, plays: int, data_dir: str, seed: int = 0) -> dict:
+    os.environ.setdefault("LAST_FM_API_KEY", "benchmark")
+    start = time.perf_counter()
+    files = dataset(source, plays, data_dir, seed)
+    generate_seconds = time.perf_counter() - start
+
+    timer = StageTimer()
+    with tempfile.TemporaryDirectory() as workdir:
+        (bench_spotify if source == "spotify" else bench_apple)(files, timer, workdir)
+    return {
+        "source": source,
+        "plays": plays,
+        "seed": seed,
+        "generate_seconds": round(generate_seconds, 2),
+        "total_seconds": round(sum(stage["seconds"] for stage in timer.stages.values()), 4),
+        "peak_rss_mb": _round_mb(peak_rss_mb()),
+        "stages": timer.stages
+    }
+
+
+def git_revision() -> dict:
+    def git(*args):
+        result = subprocess.run(["git", *args], capture_output=True, text=True, cwd=os.path.dirname(__file__))
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    return {"commit": git("rev-parse", "--short", "HEAD") or "unknown", "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def run_suite(sizes: list, sources: list, data_dir: str, output_dir: str, seed: int = 0) -> str:
+    # Every (source, size) runs in a fresh interpreter so peak memory is not inflated by earlier runs
+    results = []
+    for plays in sizes:
+        for source in sources:
+            command = [sys.executable, "-m", "benchmarks.run", "--single", source, str(plays), "--data-dir", data_dir, "--seed", str(seed)]
+            completed = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            if completed.returncode != 0:
+                results.append({"source": source, "plays": plays, "error": completed.stderr.strip().splitlines()[-1:]})
+                print(f"{source:>8} {plays:>11,} plays  FAILED: {completed.stderr.strip()}", file=sys.stderr)
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append(result)
+            stages = "  ".join(f"{name} {stage['seconds']:.2f}s/{_format_mb(stage['peak_rss_mb'])}" for name, stage in result["stages"].items())
+            print(f"{source:>8} {plays:>11,} plays  {stages}  peak {_format_mb(result['peak_rss_mb'])}")
+
+    revision = git_revision()
+    report = {
+        **revision,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cpus)",
+        "results": results
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{revision['commit']}{'-dirty' if revision['dirty'] else ''}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time load, normalize, enrich and aggregate stages on synthetic exports.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of plays, e.g. 10000 10000000")
+    parser.add_argument("--sources", nargs="+", choices=SOURCES, default=SOURCES)
+    parser.add_argument("--data-dir", default=DATA_DIR, help="where generated exports are kept between runs")
+    parser.add_argument("--output-dir", default=RESULTS_DIR)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--single", nargs=2, metavar=("SOURCE", "PLAYS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(args.single[0], int(args.single[1]), args.data_dir, args.seed)))
+    else:
+        print(f"Results written to {run_suite(args.sizes, args.sources, args.data_dir, args.output_dir, args.seed)}")
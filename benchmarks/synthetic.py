@@ -0,0 +1,190 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Real exports split the streaming history into files of roughly this many plays
+PLAYS_PER_FILE = 20_000
+CSV_CHUNKSIZE = 250_000
+
+FIRST_PLAY = np.datetime64("2016-01-01T00:00:00", "s")
+LAST_PLAY = np.datetime64("2024-12-31T23:59:59", "s")
+
+GENRES = ["Pop", "Rock", "Alternative", "Hip-Hop/Rap", "Electronic", "Dance", "Indie Pop", "Jazz", "Classical", "Soundtrack"]
+COUNTRIES = ["GB", "US", "FR", "DE", "ES", "IT", "NL", "IE", "PT", "JP"]
+# Rough city coordinates per country, jittered per play
+COUNTRY_COORDINATES = {
+    "GB": (51.5, -0.1), "US": (40.7, -74.0), "FR": (48.9, 2.4), "DE": (52.5, 13.4), "ES": (40.4, -3.7),
+    "IT": (41.9, 12.5), "NL": (52.4, 4.9), "IE": (53.3, -6.3), "PT": (38.7, -9.1), "JP": (35.7, 139.7)
+}
+
+SPOTIFY_PLATFORMS = ["ios", "android", "windows", "osx", "web_player", "cast_to_device"]
+SPOTIFY_END_REASONS = ["trackdone", "fwdbtn", "endplay", "backbtn", "logout", "unexpected-exit", "remote", "trackerror"]
+SPOTIFY_END_REASON_WEIGHTS = [0.55, 0.25, 0.08, 0.04, 0.03, 0.03, 0.01, 0.01]
+
+APPLE_DEVICES = [("iOS", "IPHONE", "17.4.1"), ("iOS", "IPAD", "16.6"), ("macOS", "MAC", "14.2"), ("Windows", "PC", "10")]
+APPLE_END_REASONS = ["NATURAL_END_OF_TRACK", "TRACK_SKIPPED_FORWARDS", "PLAYBACK_MANUALLY_PAUSED", "MANUALLY_SELECTED_PLAYBACK_OF_A_DIFF_ITEM",
+                     "TRACK_SKIPPED_BACKWARDS", "EXITED_APPLICATION", "SCRUB_END", "OTHER"]
+APPLE_END_REASON_WEIGHTS = [0.5, 0.22, 0.1, 0.08, 0.03, 0.03, 0.02, 0.02]
+APPLE_SHUFFLE = ["SHUFFLE_OFF", "SHUFFLE_ON", "SHUFFLE_UNKNOWN"]
+APPLE_EXTRA_COLUMNS = ["Build Version", "Client IP Address", "Container Type", "Content Provider", "Device App Name", "Device App Version",
+                       "Device Identifier", "Display Type", "Grouping", "Item Type", "Offline", "Provided Audio Bit Depth", "Source Type"]
+
+
+class SyntheticCatalogue:
+    # Tracks, albums and artists with a long-tailed play distribution, so caches and groupbys see realistic cardinality
+    def __init__(self, plays: int, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        tracks = max(500, plays // 25)
+        albums = max(50, tracks // 10)
+        artists = max(20, albums // 4)
+        self.album_of_track = self.rng.integers(0, albums, tracks)
+        self.artist_of_album = self.rng.integers(0, artists, albums)
+        self.song = np.array([f"Song {i}" for i in range(tracks)], dtype=object)
+        self.album = np.array([f"Album {i}" for i in range(albums)], dtype=object)[self.album_of_track]
+        self.artist = np.array([f"Artist {i}" for i in range(artists)], dtype=object)[self.artist_of_album[self.album_of_track]]
+        self.genre = np.array(GENRES, dtype=object)[self.rng.integers(0, len(GENRES), tracks)]
+        self.duration = self.rng.integers(90_000, 360_000, tracks)
+
+    def __len__(self):
+        return len(self.song)
+
+    def sample_tracks(self, count: int) -> np.ndarray:
+        # Zipf-distributed popularity: a few tracks take most plays, most are played once or twice
+        return (self.rng.zipf(1.3, count) - 1) % len(self)
+
+    def sample_times(self, count: int) -> np.ndarray:
+        span = (LAST_PLAY - FIRST_PLAY).astype("int64")
+        return np.sort(FIRST_PLAY + self.rng.integers(0, span, count).astype("timedelta64[s]"))
+
+
+def _timestamps(times: np.ndarray, suffix: str = "Z") -> np.ndarray:
+    return np.char.add(np.datetime_as_string(times, unit="s"), suffix)
+
+
+def write_spotify_export(directory: str, plays: int, seed: int = 0, plays_per_file: int = PLAYS_PER_FILE) -> list:
+    # Streaming_History_Audio_*.json files in the shape of a Spotify extended streaming history export
+    os.makedirs(directory, exist_ok=True)
+    catalogue = SyntheticCatalogue(plays, seed)
+    rng = catalogue.rng
+    times = catalogue.sample_times(plays)
+    paths = []
+    for number, start in enumerate(range(0, plays, plays_per_file)):
+        count = min(plays_per_file, plays - start)
+        tracks = catalogue.sample_tracks(count)
+        end_reason = rng.choice(SPOTIFY_END_REASONS, count, p=SPOTIFY_END_REASON_WEIGHTS)
+        finished = end_reason == "trackdone"
+        ms_played = np.where(finished, catalogue.duration[tracks], rng.integers(0, catalogue.duration[tracks]))
+        # A few percent of plays are podcast episodes, which carry no track metadata
+        episode = rng.random(count) < 0.03
+        chunk = pd.DataFrame({
+            "ts": _timestamps(times[start:start + count]),
+            "username": "synthetic",
+            "platform": rng.choice(SPOTIFY_PLATFORMS, count),
+            "ms_played": ms_played,
+            "conn_country": rng.choice(COUNTRIES, count, p=[0.7] + [0.3 / 9] * 9),
+            "ip_addr_decrypted": "192.0.2.1",
+            "user_agent_decrypted": "unknown",
+            "master_metadata_track_name": np.where(episode, None, catalogue.song[tracks]),
+            "master_metadata_album_artist_name": np.where(episode, None, catalogue.artist[tracks]),
+            "master_metadata_album_album_name": np.where(episode, None, catalogue.album[tracks]),
+            "spotify_track_uri": np.where(episode, None, np.char.add("spotify:track:", tracks.astype(str)).astype(object)),
+            "episode_name": np.where(episode, "Episode", None),
+            "episode_show_name": np.where(episode, "Show", None),
+            "spotify_episode_uri": np.where(episode, "spotify:episode:0", None),
+            "reason_start": rng.choice(["trackdone", "clickrow", "fwdbtn", "playbtn"], count),
+            "reason_end": end_reason,
+            "shuffle": rng.random(count) < 0.4,
+            "skipped": ~finished,
+            "offline": rng.random(count) < 0.05,
+            "offline_timestamp": 0,
+            "incognito_mode": False
+        })
+        path = os.path.join(directory, f"Streaming_History_Audio_{number}.json")
+        chunk.to_json(path, orient="records", indent=2)
+        paths.append(path)
+    return paths
+
+
+def write_apple_export(directory: str, plays: int, seed: int = 0, chunksize: int = CSV_CHUNKSIZE) -> dict:
+    # Apple Music Play Activity.csv plus the Library Tracks and Identifier Information files AppleParser joins against
+    os.makedirs(directory, exist_ok=True)
+    catalogue = SyntheticCatalogue(plays, seed)
+    rng = catalogue.rng
+    paths = {
+        "csv_file_path": os.path.join(directory, "Apple Music Play Activity.csv"),
+        "identifier_file_path": os.path.join(directory, "Identifier Information.json"),
+        "library_tracks_file_path": os.path.join(directory, "Apple Music Library Tracks.json")
+    }
+
+    # Library: every catalogue track once, plus a few percent of re-imported duplicates
+    library = pd.DataFrame({
+        "Title": catalogue.song, "Album": catalogue.album, "Artist": catalogue.artist, "Genre": catalogue.genre,
+        "Track Identifier": np.arange(len(catalogue)), "Play Count": rng.integers(0, 50, len(catalogue))
+    })
+    duplicates = library.sample(frac=0.03, random_state=seed).assign(Genre=None)
+    library = pd.concat([library, duplicates], ignore_index=True)
+    library.to_json(paths["library_tracks_file_path"], orient="records")
+    with open(paths["identifier_file_path"], "w") as f:
+        json.dump([], f)
+
+    times = catalogue.sample_times(plays)
+    for start in range(0, plays, chunksize):
+        count = min(chunksize, plays - start)
+        tracks = catalogue.sample_tracks(count)
+        # Some plays are of tracks not (or no longer) in the library
+        in_library = rng.random(count) < 0.92
+        device = rng.integers(0, len(APPLE_DEVICES), count)
+        country = rng.choice(COUNTRIES, count, p=[0.7] + [0.3 / 9] * 9)
+        latitude, longitude = np.array([COUNTRY_COORDINATES[code] for code in COUNTRIES]).T
+        country_code = pd.Index(COUNTRIES).get_indexer(country)
+        starts = times[start:start + count]
+        duration = catalogue.duration[tracks]
+        played = np.where(rng.random(count) < 0.6, duration, rng.integers(-1000, duration))
+        # Timestamps mostly carry milliseconds; a few are second precision or missing
+        shape = rng.random(count)
+        start_timestamps = np.where(shape < 0.9, _timestamps(starts, ".000Z"), _timestamps(starts))
+        start_timestamps = np.where(shape > 0.995, "", start_timestamps)
+        chunk = pd.DataFrame({
+            "Album Name": np.where(in_library, catalogue.album[tracks], "Unknown Album"),
+            "Container Album Name": catalogue.album[tracks],
+            "Device OS Name": np.array([d[0] for d in APPLE_DEVICES])[device],
+            "Device OS Version": np.array([d[2] for d in APPLE_DEVICES])[device],
+            "Device Type": np.array([d[1] for d in APPLE_DEVICES])[device],
+            "End Position In Milliseconds": np.maximum(played, 0),
+            "End Reason Type": rng.choice(APPLE_END_REASONS, count, p=APPLE_END_REASON_WEIGHTS),
+            "Event End Timestamp": _timestamps(starts + (np.maximum(played, 0) // 1000).astype("timedelta64[s]")),
+            "Event Received Timestamp": _timestamps(starts),
+            "Event Start Timestamp": start_timestamps,
+            "Event Timestamp": _timestamps(starts),
+            "Event Type": rng.choice(["PLAY_END", "PLAY_START", "LYRIC_DISPLAY"], count, p=[0.8, 0.15, 0.05]),
+            "Feature Name": rng.choice(["library / album-detail", "search / song", "radio", "now_playing"], count),
+            "IP City": "City",
+            "IP Country Code": country,
+            "IP Latitude": (latitude[country_code] + rng.normal(0, 0.3, count)).round(4),
+            "IP Longitude": (longitude[country_code] + rng.normal(0, 0.3, count)).round(4),
+            "IP Network Type": rng.choice(["WIFI", "CELLULAR"], count),
+            "Media Duration In Milliseconds": duration,
+            "Media Type": rng.choice(["AUDIO", "VIDEO"], count, p=[0.98, 0.02]),
+            "Milliseconds Since Play": rng.integers(0, 10_000, count),
+            "Play Duration Milliseconds": played,
+            "Shuffle Play": rng.choice(APPLE_SHUFFLE, count),
+            "Song Name": catalogue.song[tracks],
+            "Start Position In Milliseconds": 0,
+            "UTC Offset In Seconds": rng.choice([0, 3600, -18000], count)
+        })
+        for column in APPLE_EXTRA_COLUMNS:
+            chunk[column] = "x"
+        chunk.to_csv(paths["csv_file_path"], mode="w" if start == 0 else "a", header=start == 0, index=False)
+    return paths
+
+
+if __name__ == '__main__':
+    import sys
+
+    plays = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    spotify_files = write_spotify_export("./data/synthetic/spotify", plays)
+    apple_files = write_apple_export("./data/synthetic/apple", plays)
+    print(f"{len(spotify_files)} Spotify history files and {apple_files['csv_file_path']} with {plays:,} plays each")
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from timestamps import naive_datetimes
+
+
+# (label, period used to align the first edge, date_range frequency), finest first
+TIME_RESOLUTIONS = [
+    ("day", "D", "D"),
+    ("week", "W", "W-MON"),
+    ("month", "M", "MS"),
+    ("quarter", "Q", "QS"),
+    ("year", "Y", "YS")
+]
+# Upper bound on bars per time chart, whatever the length of the history. Few enough for SVG bars, so only the
+# ranking charts below ever switch to WebGL.
+MAX_TIME_BINS = 400
+# Ranked charts show every value up to MAX_BARS; longer rankings become a decimated WebGL curve of MAX_POINTS
+MAX_BARS = 200
+MAX_POINTS = 5000
+
+
+def time_edges(start, end, max_bins: int = MAX_TIME_BINS) -> tuple:
+    # Finest resolution whose bins over [start, end] fit in max_bins; returns (label, edges) with edges[-1] > end
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    for label, period, frequency in TIME_RESOLUTIONS:
+        first = start.to_period(period).start_time
+        edges = pd.date_range(first, end, freq=frequency)
+        edges = edges.append(pd.DatetimeIndex([edges[-1] + pd.tseries.frequencies.to_offset(frequency)]))
+        if len(edges) - 1 <= max_bins or label == TIME_RESOLUTIONS[-1][0]:
+            return label, edges
+
+
+def time_histogram(times, values: dict = None, max_bins: int = MAX_TIME_BINS) -> tuple:
+    # Sums `values` (name -> array aligned with times; plain counts if omitted) into adaptive time bins with NumPy.
+    # Returns (resolution label, DataFrame of bin start plus one column per value).
+    times = pd.DatetimeIndex(naive_datetimes(times))
+    values = values if values is not None else {"count": np.ones(len(times), dtype="int64")}
+    if not len(times):
+        return "day", pd.DataFrame({"bin": pd.DatetimeIndex([]), **{name: [] for name in values}})
+
+    label, edges = time_edges(times.min(), times.max(), max_bins)
+    ticks = times.to_numpy(dtype="datetime64[ns]").astype("int64")
+    bins = np.searchsorted(edges.to_numpy(dtype="datetime64[ns]").astype("int64"), ticks, side="right") - 1
+    binned = pd.DataFrame({"bin": edges[:-1]})
+    for name, weights in values.items():
+        weights = np.asarray(weights)
+        sums = np.bincount(bins, weights=weights.astype("float64"), minlength=len(edges) - 1)
+        # Counts stay integers; only genuinely fractional values (e.g. hours) come back as floats
+        binned[name] = sums.astype("int64") if weights.dtype.kind in "biu" else sums
+    return label, binned
+
+
+def histogram_figure(binned: pd.DataFrame, columns: list, label: str, title: str = None, y_label: str = "count"):
+    figure = go.Figure([go.Bar(x=binned["bin"], y=binned[column], name=column) for column in columns])
+    figure.update_layout(title=title, barmode="stack", bargap=0, xaxis_title=label, yaxis_title=y_label,
+                         showlegend=len(columns) > 1)
+    return figure
+
+
+def ranking_figure(counts: pd.Series, x_label: str, title: str = None, y_label: str = "count"):
+    # Short rankings are bar charts as before; long tails keep every head value plus evenly spaced ranks after it
+    if len(counts) <= MAX_BARS:
+        figure = go.Figure(go.Bar(x=counts.index, y=counts.to_numpy()))
+        figure.update_layout(title=title, xaxis_title=x_label, yaxis_title=y_label)
+        return figure
+    ranks = np.union1d(np.arange(MAX_BARS), np.linspace(MAX_BARS, len(counts) - 1, MAX_POINTS - MAX_BARS).astype("int64"))
+    figure = go.Figure(go.Scattergl(x=ranks + 1, y=counts.to_numpy()[ranks], hovertext=counts.index[ranks].astype(str),
+                                    mode="lines+markers", marker={"size": 3}))
+    figure.update_layout(title=title, xaxis_title=f"{x_label} rank (of {len(counts):,})", yaxis_title=y_label)
+    return figure
+
+
+if __name__ == '__main__':
+    import time
+
+    rows = 5_000_000
+    rng = np.random.default_rng(0)
+    times = pd.to_datetime("2012-01-01") + pd.to_timedelta(rng.integers(0, 12 * 365 * 86400, rows), unit="s")
+    start = time.perf_counter()
+    label, binned = time_histogram(times)
+    print(f"{rows:,} timestamps -> {len(binned)} {label} bins in {time.perf_counter() - start:.2f}s")
+    figure = histogram_figure(binned, ["count"], label)
+    print(f"figure JSON {len(figure.to_json()) / 1e3:.0f} kB")
+
+    counts = pd.Series(np.sort(rng.zipf(1.5, 200_000))[::-1], index=[f"Track {i}" for i in range(200_000)])
+    figure = ranking_figure(counts, "track")
+    print(f"{len(counts):,} ranked tracks -> {type(figure.data[0]).__name__} with {len(figure.data[0].x):,} points, "
+          f"figure JSON {len(figure.to_json()) / 1e3:.0f} kB")
@@ -0,0 +1,70 @@
+import pandas as pd
+
+
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MS_PER_HOUR = 3_600_000
+
+# Few distinct values repeated millions of times: stored once in a dictionary, rows hold small codes
+CATEGORICAL_COLUMNS = ["Platform", "End reason", "Shuffle", "Country", "Genre set"]
+
+# Many distinct values: contiguous Arrow string buffers instead of one Python object per row
+STRING_COLUMNS = ["Artist", "Album name", "Song name", "Song and Artist name", "Track URI"]
+
+INTEGER_COLUMNS = {
+    "Day number": "int8",
+    "Month number": "int8",
+    "Year": "int16",
+    "Hour": "int8"
+}
+
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    dtypes = {column: "category" for column in CATEGORICAL_COLUMNS}
+    dtypes.update({column: "string[pyarrow]" for column in STRING_COLUMNS})
+    dtypes.update(INTEGER_COLUMNS)
+    df = df.astype({column: dtype for column, dtype in dtypes.items() if column in df.columns})
+    if "Day name" in df.columns:
+        df["Day name"] = pd.Categorical(df["Day name"], categories=DAY_NAMES, ordered=True)
+    return df
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    report = pd.DataFrame({
+        "Before dtype": before.dtypes.astype(str),
+        "After dtype": after.dtypes.astype(str).reindex(before.columns),
+        "Before bytes": before.memory_usage(index=False, deep=True),
+        "After bytes": after.memory_usage(index=False, deep=True).reindex(before.columns)
+    })
+    report.loc["Total"] = ["", "", report["Before bytes"].sum(), report["After bytes"].sum()]
+    report["Saving %"] = (100 * (1 - report["After bytes"] / report["Before bytes"])).round(1)
+    return report
+
+
+if __name__ == '__main__':
+    import numpy as np
+
+    rows = 1_000_000
+    rng = np.random.default_rng(0)
+    datetimes = pd.Series(pd.to_datetime("2015-01-01") + pd.to_timedelta(rng.integers(0, 10 * 365 * 24 * 3600, rows), unit="s"))
+    artists = np.array([f"Artist {i}" for i in range(5_000)], dtype=object)[rng.integers(0, 5_000, rows)]
+    songs = np.array([f"Song {i}" for i in range(50_000)], dtype=object)[rng.integers(0, 50_000, rows)]
+    legacy = pd.DataFrame({
+        "Datetime": datetimes,
+        "Day name": datetimes.dt.day_name().astype(object),
+        "Day number": datetimes.dt.day.astype("int64"),
+        "Month number": datetimes.dt.month.astype("int64"),
+        "Year": datetimes.dt.year.astype("int64"),
+        "Hour": datetimes.dt.hour.astype("int64"),
+        "Artist": artists,
+        "Album name": artists + " LP",
+        "Song name": songs,
+        "Song and Artist name": songs + " | " + artists,
+        "Platform": rng.choice(np.array(["android", "ios", "windows", "web_player"], dtype=object), rows),
+        "Milliseconds played": rng.integers(0, 300_000, rows),
+        "End reason": rng.choice(np.array(["track_done", "forward_button", "pause", "unknown"], dtype=object), rows),
+        "Shuffle": rng.choice(np.array(["On", "Off"], dtype=object), rows),
+        "Country": rng.choice(np.array(["United Kingdom", "United States", "Spain"], dtype=object), rows)
+    })
+    # Recreate the object-string columns the parsers used to emit
+    legacy = legacy.astype({column: object for column in ["Day name"] + CATEGORICAL_COLUMNS + STRING_COLUMNS})
+    print(memory_report(legacy, compact_dtypes(legacy)).to_string())
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from timestamps import datetime_ticks
+
+
+class DiscoveryIndex:
+    # Persistent first-seen index over integer track keys. A play is a discovery only if it is the first play of its
+    # track across the whole history, so narrowing the date range never turns repeats into discoveries.
+    def __init__(self):
+        self.keys = pd.Index([], dtype=object)
+        self.first_seen = np.empty(0, dtype="int64")
+
+    def __len__(self):
+        return len(self.keys)
+
+    def encode(self, tracks: pd.Series) -> np.ndarray:
+        # Integer key per play, -1 for missing or never-seen tracks
+        return self.keys.get_indexer(tracks)
+
+    def update(self, tracks: pd.Series, datetimes: pd.Series) -> np.ndarray:
+        # Adds new plays (in any order) and returns their integer track keys; negative integer keys mean no track
+        present = tracks.notna() & (tracks >= 0) if pd.api.types.is_integer_dtype(tracks) else tracks.notna()
+        new_keys = pd.Index(tracks[present].unique()).difference(self.keys, sort=False)
+        if len(new_keys):
+            # The first batch sets the key dtype, so integer track keys are looked up as integers rather than objects
+            self.keys = self.keys.append(new_keys) if len(self.keys) else new_keys
+            self.first_seen = np.concatenate([self.first_seen, np.full(len(new_keys), np.iinfo("int64").max)])
+
+        codes = self.encode(tracks)
+        valid = codes >= 0
+        batch_first = pd.Series(datetime_ticks(datetimes)[valid]).groupby(codes[valid]).min()
+        current = self.first_seen[batch_first.index]
+        self.first_seen[batch_first.index] = np.minimum(current, batch_first.to_numpy())
+        return codes
+
+    def classify(self, codes: np.ndarray, datetimes: pd.Series) -> np.ndarray:
+        # True for the single play of each track that matches its first-seen time, False for repeats
+        valid = codes >= 0
+        candidates = valid.copy()
+        candidates[valid] = datetime_ticks(datetimes)[valid] == self.first_seen[codes[valid]]
+        duplicate = pd.Series(np.where(candidates, codes, -1)).duplicated().to_numpy()
+        return candidates & ~duplicate
+
+    def first_seen_times(self) -> pd.Series:
+        return pd.Series(pd.to_datetime(self.first_seen), index=self.keys, name="First seen")
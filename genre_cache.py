@@ -0,0 +1,126 @@
+import json
+import sqlite3
+import threading
+import time
+
+from os import environ, makedirs, path
+
+
+class GenreCache:
+    # SQLite file shared by every parser instance and process on the machine; WAL mode lets readers and a writer coexist
+    DEFAULT_PATH = path.join(path.expanduser("~"), ".cache", "music_analyser", "genre_cache.sqlite")
+    DAY = 24 * 60 * 60
+    BATCH_SIZE = 400
+
+    def __init__(self, db_path: str = None, ttl: float = 90 * DAY, negative_ttl: float = 7 * DAY, max_entries: int = 500_000):
+        self.db_path = db_path or environ.get("GENRE_CACHE_PATH", self.DEFAULT_PATH)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        if self.db_path != ":memory:":
+            makedirs(path.dirname(path.abspath(self.db_path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS genres (
+                    artist TEXT NOT NULL,
+                    track TEXT NOT NULL,
+                    tags TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (artist, track)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS genres_last_access ON genres (last_access)")
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so each thread gets its own
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _is_fresh(self, tags: list, fetched_at: float, now: float) -> bool:
+        ttl = self.ttl if tags else self.negative_ttl
+        return now - fetched_at < ttl
+
+    def get_many(self, pairs) -> dict:
+        pairs = list(dict.fromkeys(pairs))
+        now = time.time()
+        found = {}
+        conn = self._connection()
+        for i in range(0, len(pairs), self.BATCH_SIZE):
+            batch = pairs[i:i + self.BATCH_SIZE]
+            placeholders = ", ".join(["(?, ?)"] * len(batch))
+            params = [value for pair in batch for value in pair]
+            rows = conn.execute(
+                f"SELECT artist, track, tags, fetched_at FROM genres WHERE (artist, track) IN (VALUES {placeholders})", params
+            ).fetchall()
+            for artist, track, tags, fetched_at in rows:
+                tags = json.loads(tags)
+                if self._is_fresh(tags, fetched_at, now):
+                    found[(artist, track)] = tags
+
+        if found:
+            with conn:
+                conn.executemany("UPDATE genres SET last_access = ? WHERE artist = ? AND track = ?",
+                                 [(now, artist, track) for artist, track in found])
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(pairs) - len(found)
+        return found
+
+    def get(self, artist: str, track: str):
+        return self.get_many([(artist, track)]).get((artist, track))
+
+    def put_many(self, genres: dict):
+        if not genres:
+            return
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO genres (artist, track, tags, fetched_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                [(artist, track, json.dumps(tags), now, now) for (artist, track), tags in genres.items()]
+            )
+        self.evict()
+
+    def put(self, artist: str, track: str, genres: list):
+        self.put_many({(artist, track): genres})
+
+    def evict(self):
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM genres WHERE (tags = '[]' AND fetched_at < ?) OR fetched_at < ?",
+                         (now - self.negative_ttl, now - self.ttl))
+            # Least recently used entries go first once the cache is over its size cap
+            conn.execute("""
+                DELETE FROM genres WHERE rowid IN (
+                    SELECT rowid FROM genres ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM genres")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM genres").fetchone()[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self)
+        }
@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from genre_cache import GenreCache
+from instrumentation import RequestStats
+
+
+class RateLimiter:
+    # Token bucket shared by all worker threads
+    def __init__(self, requests_per_second: float, burst: int = 1):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) / self.interval)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) * self.interval
+            time.sleep(wait)
+
+
+class GenreEnricher:
+    LAST_FM_URL = "https://ws.audioscrobbler.com/2.0/"
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+    # Last.fm error codes that mean "try again later" (operation failed, service unavailable, rate limit)
+    RETRY_ERROR_CODES = {8, 11, 16, 29}
+    # "Track not found" is a real answer and is cached as no genres; any other error (bad or suspended key,
+    # authentication failed, ...) says nothing about the track and is a failed lookup
+    NOT_FOUND_ERROR_CODE = 6
+
+    def __init__(self, api_key: str, base_url: str = None, max_workers: int = 8, requests_per_second: float = 5.0,
+                 max_retries: int = 4, backoff_factor: float = 0.5, timeout: float = 10.0, cache: GenreCache = None):
+        self.api_key = api_key
+        self.cache = cache
+        self.base_url = base_url or self.LAST_FM_URL
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(requests_per_second, burst=max_workers)
+        self.request_stats = RequestStats()
+
+        # One pooled session so connections are reused across all lookups
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"user-agent": "Music Analyser"})
+
+    def enrich(self, pairs) -> dict:
+        unique_pairs = list(dict.fromkeys(pairs))
+        genres = self.cache.get_many(unique_pairs) if self.cache is not None else {}
+        missing = [pair for pair in unique_pairs if pair not in genres]
+        self.request_stats.record_cache(len(unique_pairs) - len(missing), len(missing))
+        if not missing:
+            return genres
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            fetched = dict(zip(missing, pool.map(lambda pair: self.fetch_genres(*pair), missing)))
+        # Failed lookups (None) are returned as no genres but never cached, so they are retried next run
+        if self.cache is not None:
+            self.cache.put_many({pair: tags for pair, tags in fetched.items() if tags is not None})
+        genres.update({pair: tags or [] for pair, tags in fetched.items()})
+        return genres
+
+    def fetch_genres(self, artist: str, track: str):
+        payload = {
+            "api_key": self.api_key,
+            "method": "track.getInfo",
+            "format": "json",
+            "artist": artist,
+            "track": track
+        }
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            retry_after = None
+            start = time.perf_counter()
+            try:
+                r = self.session.get(self.base_url, params=payload, timeout=self.timeout)
+                if r.status_code in self.RETRY_STATUS_CODES:
+                    retry_after = r.headers.get("Retry-After")
+                elif r.status_code != 200:
+                    self.request_stats.record(time.perf_counter() - start, "error")
+                    return None
+                else:
+                    body = r.json()
+                    if not isinstance(body, dict):
+                        self.request_stats.record(time.perf_counter() - start, "error")
+                        return None
+                    error = body.get("error")
+                    if error is None or error == self.NOT_FOUND_ERROR_CODE:
+                        self.request_stats.record(time.perf_counter() - start, "ok")
+                        return self.parse_genres(body)
+                    if error not in self.RETRY_ERROR_CODES:
+                        self.request_stats.record(time.perf_counter() - start, "error")
+                        return None
+            except (ValueError, json.JSONDecodeError):
+                self.request_stats.record(time.perf_counter() - start, "error")
+                return None
+            except requests.RequestException:
+                pass
+            self.request_stats.record(time.perf_counter() - start, "retry" if attempt < self.max_retries else "error")
+            if attempt < self.max_retries:
+                time.sleep(self._backoff(attempt, retry_after))
+        # None marks a lookup that failed, as opposed to a track with no tags
+        return None
+
+    @staticmethod
+    def parse_genres(body: dict) -> list:
+        try:
+            response = body['track']['toptags']['tag']
+        except (KeyError, TypeError):
+            response = []
+        return [g['name'] for g in response]
+
+    def _backoff(self, attempt: int, retry_after: str = None) -> float:
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff_factor * (2 ** attempt)
+
+
+if __name__ == '__main__':
+    from lastfm_stub import StubLastFmServer
+
+    pairs = [(f"Artist {i % 500}", f"Track {i}") for i in range(2000)]
+    with StubLastFmServer(latency=0.02, error_rate=0.01) as server:
+        enricher = GenreEnricher("stub-key", base_url=server.url, max_workers=16, requests_per_second=0, backoff_factor=0.01)
+        start = time.perf_counter()
+        genres = enricher.enrich(pairs)
+        elapsed = time.perf_counter() - start
+        print(f"{len(genres)} tracks, {server.request_count} requests in {elapsed:.2f}s ({len(genres) / elapsed:.0f} tracks/s)")
+        print(enricher.request_stats.summary())
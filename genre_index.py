@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from compact_schema import MS_PER_HOUR
+
+
+# Joins the tags of one genre set into a single categorical value; a control character so no real tag contains it
+GENRE_SEPARATOR = "\x1f"
+
+
+def genre_sets(genre_lists) -> pd.Categorical:
+    # One categorical value per entry, so each distinct set of tags is held once and rows hold only its code.
+    # Entries without tags are missing rather than an empty set.
+    return pd.Categorical([GENRE_SEPARATOR.join(genres) if len(genres) else None for genres in genre_lists])
+
+
+class GenreIndex:
+    # Genre tags interned to integer ids, with every distinct genre set stored once in CSR form: the tags of set s are
+    # values[offsets[s]:offsets[s + 1]]. Plays only carry a set code, so per-genre totals are two bincounts and
+    # filtering is a lookup table indexed by set code; nothing is exploded per play.
+    def __init__(self, sets: pd.Series):
+        sets = pd.Series(sets).astype("category")
+        self.set_codes = sets.cat.codes.to_numpy()
+        set_tags = [label.split(GENRE_SEPARATOR) for label in sets.cat.categories]
+        lengths = np.array([len(tags) for tags in set_tags], dtype="int64")
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+        ids, self.genres = pd.factorize(pd.Series([tag for tags in set_tags for tag in tags], dtype=object))
+        self.values = ids.astype("int32")
+        # Set of each value, for going from genre ids back to the sets that contain them
+        self._value_sets = np.repeat(np.arange(len(set_tags)), lengths)
+
+    def __len__(self):
+        return len(self.genres)
+
+    @property
+    def set_count(self) -> int:
+        return len(self.offsets) - 1
+
+    def _per_set(self, weights: np.ndarray = None, mask: np.ndarray = None) -> np.ndarray:
+        tagged = self.set_codes >= 0
+        if mask is not None:
+            tagged &= np.asarray(mask, dtype=bool)
+        weights = None if weights is None else np.asarray(weights, dtype="float64")[tagged]
+        return np.bincount(self.set_codes[tagged], weights=weights, minlength=self.set_count)
+
+    def totals(self, weights: np.ndarray = None, mask: np.ndarray = None) -> pd.Series:
+        # Sum of weights (plays when omitted) per genre, largest first; a play counts towards every genre of its set
+        per_set = self._per_set(weights, mask)
+        per_genre = np.bincount(self.values, weights=per_set[self._value_sets].astype("float64"), minlength=len(self))
+        totals = pd.Series(per_genre, index=pd.Index(self.genres, name="Genre"))
+        if weights is None:
+            totals = totals.astype("int64")
+        return totals.sort_values(ascending=False, kind="stable")
+
+    def plays(self, mask: np.ndarray = None) -> pd.Series:
+        return self.totals(mask=mask).rename("plays")
+
+    def hours(self, ms_played, mask: np.ndarray = None) -> pd.Series:
+        return (self.totals(ms_played, mask) / MS_PER_HOUR).rename("hours")
+
+    def contains(self, genres) -> np.ndarray:
+        # Boolean mask of the plays tagged with any of `genres`
+        genres = [genres] if isinstance(genres, str) else list(genres)
+        ids = pd.Index(self.genres).get_indexer(genres)
+        matching_sets = np.zeros(self.set_count + 1, dtype=bool)
+        matching_sets[self._value_sets[np.isin(self.values, ids[ids >= 0])]] = True
+        # The trailing slot is never set, so untagged plays (code -1) are always excluded
+        return matching_sets[self.set_codes]
+
+    def lists(self) -> pd.Series:
+        # Per-play lists of tag strings, the old Genre layout; plays with the same set share one list object
+        per_set = np.empty(self.set_count + 1, dtype=object)
+        for code, (start, end) in enumerate(zip(self.offsets[:-1], self.offsets[1:])):
+            per_set[code] = list(self.genres[self.values[start:end]])
+        per_set[-1] = []
+        return pd.Series(per_set[self.set_codes])
+
+
+if __name__ == '__main__':
+    import time
+
+    rows = 5_000_000
+    rng = np.random.default_rng(0)
+    tags = np.array(["rock", "indie", "pop", "electronic", "jazz", "hip-hop", "folk", "metal", "soul", "ambient"], dtype=object)
+    tracks = [list(rng.choice(tags, rng.integers(0, 5), replace=False)) for _ in range(50_000)]
+    plays = rng.zipf(1.3, rows) % len(tracks)
+    ms = rng.integers(0, 300_000, rows)
+
+    start = time.perf_counter()
+    legacy = pd.Series([tracks[track] for track in plays])
+    exploded = pd.DataFrame({"Genre": legacy, "ms": ms}).explode("Genre").groupby("Genre")["ms"].sum()
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    track_sets = genre_sets(tracks)
+    sets = pd.Series(pd.Categorical.from_codes(track_sets.codes[plays], track_sets.categories))
+    index = GenreIndex(sets)
+    hours = index.hours(ms)
+    rock = index.contains("rock")
+    print(f"{rows:,} plays, {index.set_count:,} genre sets, {len(index)} genres")
+    print(f"list column + explode: {legacy_seconds:.2f}s, set codes + CSR index: {time.perf_counter() - start:.2f}s")
+    print(f"list column {legacy.memory_usage(deep=True) / 1e6:.0f} MB, set codes {sets.memory_usage(deep=True) / 1e6:.0f} MB")
+    assert np.allclose(hours.sort_index(), exploded.sort_index() / MS_PER_HOUR)
+    print(hours.head(), f"\n{rock.sum():,} rock plays")
@@ -0,0 +1,175 @@
+import json
+import os
+import shutil
+
+from os import environ, path
+
+import numpy as np
+import pandas as pd
+
+from dimensions import Dimensions
+from normalized_cache import NormalizedCache
+from parser_engine import ListeningData
+from rollup import RollupCube
+from timestamps import datetime_ticks
+
+
+class IncrementalStore:
+    # Persisted, append-only normalised history. Each refresh adds one Arrow segment holding only plays not seen before,
+    # identified by (timestamp, track URI), and folds just those plays into a stored rollup. Dimension tables are shared
+    # by all segments, so a track keeps the same integer key across refreshes.
+    DEFAULT_DIR = path.join(path.expanduser("~"), ".cache", "music_analyser", "store")
+    # Segments are merged once there are this many, so loading never opens an unbounded number of files
+    MAX_SEGMENTS = 32
+
+    def __init__(self, store_dir: str = None, schema_version: int = None):
+        self.store_dir = store_dir or environ.get("LISTENING_STORE_DIR", self.DEFAULT_DIR)
+        self.segments = NormalizedCache(path.join(self.store_dir, "segments"))
+        self._manifest_path = path.join(self.store_dir, "manifest.json")
+        self.manifest = self._read_manifest()
+        # A store written by an older parser schema can't be appended to, so it is started again
+        if schema_version is not None and self.manifest["schema_version"] not in (None, schema_version):
+            self.clear()
+        if schema_version is not None:
+            self.manifest["schema_version"] = schema_version
+        self.keys = np.load(self._keys_path) if path.exists(self._keys_path) else np.empty(0, dtype="uint64")
+        self.dimensions = Dimensions.load(self.segments, "store") or Dimensions()
+
+    def _read_manifest(self) -> dict:
+        if path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                return json.load(f)
+        return self._empty_manifest()
+
+    @staticmethod
+    def _empty_manifest() -> dict:
+        return {"schema_version": None, "segments": [], "rows": 0, "next_segment": 0, "rollup": "rollup", "keys": "keys.npy"}
+
+    @property
+    def rollup_dir(self) -> str:
+        # Stores written before the rollup and keys were versioned use the fixed names
+        return path.join(self.store_dir, self.manifest.get("rollup", "rollup"))
+
+    @property
+    def _keys_path(self) -> str:
+        return path.join(self.store_dir, self.manifest.get("keys", "keys.npy"))
+
+    def _write_manifest(self):
+        tmp_path = f"{self._manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _next_segment(self) -> str:
+        self.manifest["next_segment"] += 1
+        return f"part-{self.manifest['next_segment'] - 1:05d}"
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    @staticmethod
+    def play_keys(datetimes: pd.Series, track_uris: pd.Series) -> np.ndarray:
+        # 64-bit hash of (timestamp, track URI); both are converted to plain values so every dtype hashes alike
+        frame = pd.DataFrame({
+            "ts": datetime_ticks(datetimes),
+            "uri": pd.Series(track_uris.to_numpy(dtype=object)).fillna("").to_numpy(dtype=object)
+        })
+        return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        positions = np.searchsorted(self.keys, keys).clip(max=max(len(self.keys) - 1, 0))
+        return self.keys[positions] == keys if len(self.keys) else np.zeros(len(keys), dtype=bool)
+
+    def append(self, delta: pd.DataFrame, datetime_column: str = "Datetime", uri_column: str = "Track URI") -> int:
+        # `delta` must already exclude stored plays; returns the number of rows written. The segment, rollup and keys
+        # are written under new names that only the manifest refers to, so replacing the manifest commits the append:
+        # a crash before it leaves the previous state, which the next refresh appends to again.
+        if not len(delta):
+            return 0
+        segment = self._next_segment()
+        self.segments.store(segment, delta.reset_index(drop=True))
+
+        # `delta` was interned into self.dimensions by the parser; they are saved before anything that refers to them.
+        # Ids are never reassigned, so the tables written here still describe the previous manifest's segments.
+        self.dimensions.store(self.segments, "store")
+        cube = self.rollup()
+        if cube is None:
+            cube = RollupCube(ListeningData(delta, self.dimensions))
+        else:
+            cube.update(ListeningData(delta, self.dimensions))
+        version = segment.replace("part-", "")
+        rollup_name, keys_name = f"rollup-{version}", f"keys-{version}.npy"
+        # Left over if an earlier attempt at this append crashed
+        shutil.rmtree(path.join(self.store_dir, rollup_name), ignore_errors=True)
+        cube.save(path.join(self.store_dir, rollup_name))
+        keys = np.union1d(self.keys, self.play_keys(delta[datetime_column], delta[uri_column]))
+        np.save(path.join(self.store_dir, keys_name), keys)
+
+        old_rollup, old_keys = self.rollup_dir, self._keys_path
+        self.manifest["segments"].append(segment)
+        self.manifest["rows"] += len(delta)
+        self.manifest["rollup"], self.manifest["keys"] = rollup_name, keys_name
+        self._write_manifest()
+        self.keys = keys
+        shutil.rmtree(old_rollup, ignore_errors=True)
+        if path.exists(old_keys):
+            os.remove(old_keys)
+        if len(self.manifest["segments"]) > self.MAX_SEGMENTS:
+            self.compact()
+        return len(delta)
+
+    def load(self, pending: pd.DataFrame = None) -> pd.DataFrame:
+        # Still reads and copies every segment, so this is proportional to the stored history; appends are not.
+        # `pending` holds plays that were parsed but not appended, and is included after the stored ones.
+        frames = [self.segments.load(segment) for segment in self.manifest["segments"]]
+        if pending is not None and len(pending):
+            frames.append(pending.reset_index(drop=True))
+        if not frames:
+            return pd.DataFrame()
+        if len(frames) == 1:
+            return frames[0]
+        # Segments carry their own category sets; giving them all the union keeps the concatenation categorical, so
+        # only the codes are remapped rather than every value hashed again
+        for column in frames[0].columns:
+            if all(isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames):
+                categories = frames[0][column].cat.categories
+                for frame in frames[1:]:
+                    categories = categories.append(frame[column].cat.categories.difference(categories))
+                for frame in frames:
+                    frame[column] = frame[column].cat.set_categories(categories)
+        return pd.concat(frames, ignore_index=True)
+
+    def rollup(self):
+        return RollupCube.load(self.rollup_dir) if path.exists(path.join(self.rollup_dir, "rollup.json")) else None
+
+    def compact(self):
+        # Rewrites all segments as one; the keys and rollup are unchanged
+        df = self.load()
+        old_segments = self.manifest["segments"]
+        segment = self._next_segment()
+        self.segments.store(segment, df)
+        self.manifest["segments"] = [segment]
+        self._write_manifest()
+        for old_segment in old_segments:
+            self.segments.remove(old_segment)
+
+    def clear(self):
+        if path.isdir(self.store_dir):
+            shutil.rmtree(self.store_dir)
+        self.manifest = self._empty_manifest()
+        self.keys = np.empty(0, dtype="uint64")
+        self.dimensions = Dimensions()
+
+
+if __name__ == '__main__':
+    import glob
+    import sys
+
+    from spotify_parser import SpotifyParser
+
+    # Refresh the store from a new export: only plays not already stored are parsed, enriched and aggregated
+    files = sorted(glob.glob(sys.argv[1] if len(sys.argv) > 1 else "./data/Streaming_History_Audio_*.json"))
+    store = IncrementalStore(schema_version=SpotifyParser.SCHEMA_VERSION)
+    parser = SpotifyParser(files, store=store)
+    print(f"{len(parser.delta):,} new plays appended, {len(store):,} stored in {len(store.manifest['segments'])} segment(s)")
+    print(parser.report.to_frame())
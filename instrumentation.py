@@ -0,0 +1,154 @@
+import json
+import os
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+
+def rss_mb() -> float:
+    # Current resident memory of this process, None where it can't be measured
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        pass
+    # No procfs (macOS, Windows): psutil if it is installed, otherwise the process high-water mark where available
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except ImportError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    # High-water mark of resident memory, None where neither resource nor psutil is available
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        # Windows reports its peak working set; elsewhere only the current RSS is known
+        memory = psutil.Process().memory_info()
+        return getattr(memory, "peak_wset", memory.rss) / 1e6
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+class RequestStats:
+    # Thread-safe log of Last.fm HTTP requests (latency and outcome) and genre cache hits, kept per enricher
+    OUTCOMES = ("ok", "retry", "error")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.outcomes = []
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def record(self, seconds: float, outcome: str):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.outcomes.append(outcome)
+
+    def record_cache(self, hits: int, misses: int):
+        with self._lock:
+            self.cache_hits += hits
+            self.cache_misses += misses
+
+    def mark(self) -> tuple:
+        # Position to pass to summary() so one parse only reports its own requests
+        with self._lock:
+            return len(self.latencies), self.cache_hits, self.cache_misses
+
+    def summary(self, since: tuple = (0, 0, 0)) -> dict:
+        with self._lock:
+            latencies = np.array(self.latencies[since[0]:]) * 1000
+            outcomes = pd.Series(self.outcomes[since[0]:], dtype=object)
+            hits, misses = self.cache_hits - since[1], self.cache_misses - since[2]
+        percentiles = np.percentile(latencies, [50, 90, 99]).round(1).tolist() if len(latencies) else [None] * 3
+        return {
+            "requests": len(latencies),
+            **{outcome: int((outcomes == outcome).sum()) for outcome in self.OUTCOMES},
+            "cache_hits": hits,
+            "cache_misses": misses,
+            "latency_ms": {
+                "p50": percentiles[0],
+                "p90": percentiles[1],
+                "p99": percentiles[2],
+                "max": round(float(latencies.max()), 1) if len(latencies) else None
+            }
+        }
+
+
+class ParseReport:
+    # Wall time, rows in/out and resident-memory delta for each stage of one parse, plus Last.fm request stats
+    def __init__(self, name: str):
+        self.name = name
+        self.stages = []
+        self.cache_hit = False
+        self.lastfm = None
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int = None, part_of: str = None):
+        # Callers set record["rows_out"] inside the block
+        record = {"stage": name, "rows_in": rows_in, "rows_out": None, "seconds": None, "memory_delta_mb": None, "part_of": part_of}
+        memory = rss_mb()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 4)
+            after = rss_mb()
+            record["memory_delta_mb"] = None if memory is None or after is None else round(after - memory, 1)
+            self.stages.append(record)
+
+    def add(self, name: str, seconds: float, rows_in: int = None, rows_out: int = None, part_of: str = None):
+        # For work accumulated across chunks, e.g. the library join inside the activity read
+        self.stages.append({"stage": name, "rows_in": rows_in, "rows_out": rows_out, "seconds": round(seconds, 4),
+                            "memory_delta_mb": None, "part_of": part_of})
+
+    @property
+    def total_seconds(self) -> float:
+        # Sub-stages are already counted in the stage they are part of
+        return round(sum(stage["seconds"] for stage in self.stages if stage["part_of"] is None), 4)
+
+    def to_dict(self) -> dict:
+        return {
+            "parser": self.name,
+            "cache_hit": self.cache_hit,
+            "total_seconds": self.total_seconds,
+            "stages": self.stages,
+            "lastfm": self.lastfm
+        }
+
+    def to_json(self, path: str = None) -> str:
+        text = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.stages, columns=["stage", "part_of", "rows_in", "rows_out", "seconds", "memory_delta_mb"])
+
+
+def show_report(report: ParseReport, container=None):
+    # Optional Streamlit panel, the sidebar by default
+    import streamlit as st
+
+    container = container or st.sidebar
+    container.write(f"**{report.name}** {report.total_seconds:.2f}s" + (" (from cache)" if report.cache_hit else ""))
+    container.dataframe(report.to_frame().drop(columns="part_of").set_index("stage"))
+    if report.lastfm is not None:
+        latency = report.lastfm["latency_ms"]
+        container.write(f"Last.fm: {report.lastfm['requests']} requests, {report.lastfm['cache_hits']} cache hits, "
+                        f"p50 {latency['p50']} ms, p90 {latency['p90']} ms, p99 {latency['p99']} ms")
+    container.download_button("Download report (JSON)", report.to_json(), file_name=f"{report.name}_report.json",
+                              mime="application/json", key=f"{report.name}_report")
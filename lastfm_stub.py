@@ -0,0 +1,89 @@
+import json
+import random
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connections under a 16-worker enricher and adds ~1s SYN retries
+    request_queue_size = 128
+
+
+class StubLastFmServer:
+    # Local stand-in for the Last.fm track.getInfo endpoint, used to benchmark enrichment offline
+    TAGS = ["rock", "pop", "indie", "electronic", "hip-hop", "jazz", "folk", "metal", "soul", "classical"]
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = _StubHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/2.0/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count_request(self):
+        with self._lock:
+            self.request_count += 1
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real API, so the enricher's pooled session reuses connections
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; with Nagle on, each response waits for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub._count_request()
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.error_rate and random.random() < stub.error_rate:
+                    self.send_response(random.choice([429, 503]))
+                    self.send_header("Retry-After", "0")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                query = parse_qs(urlparse(self.path).query)
+                artist = query.get("artist", [""])[0]
+                track = query.get("track", [""])[0]
+                # Deterministic tags per track so repeated runs give identical genres
+                seed = sum(map(ord, artist + track))
+                tags = [{"name": stub.TAGS[(seed + i) % len(stub.TAGS)]} for i in range(seed % 4)]
+                body = json.dumps({"track": {"name": track, "toptags": {"tag": tags}}}).encode()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from normalized_cache import NormalizedCache
+
+
+class LibraryIndex:
+    # De-duplicated (song, album) -> library attributes lookup. Keys are interned into integer codes once, and
+    # activity chunks are probed against them, so duplicate library entries can never multiply play rows.
+    VERSION = 1
+    KEY_COLUMNS = ["Song Name", "Album Name"]
+    VALUE_COLUMNS = ["Artist", "Genre"]
+    LIBRARY_RENAME = {"Title": "Song Name", "Album": "Album Name"}
+
+    def __init__(self, entries: pd.DataFrame):
+        # `entries` is already de-duplicated, with a "Duplicates" count of the extra library rows per key
+        self.entries = entries.reset_index(drop=True)
+        self.keys = pd.MultiIndex.from_frame(self.entries[self.KEY_COLUMNS])
+        self._duplicated_key = self.entries["Duplicates"].to_numpy() > 0
+        self.stats = {
+            "library_entries": int(len(self.entries) + self.entries["Duplicates"].sum()),
+            "unique_keys": len(self.entries),
+            "duplicate_entries": int(self.entries["Duplicates"].sum()),
+            "plays_probed": 0,
+            "plays_matched": 0,
+            "plays_missed": 0,
+            "plays_matching_duplicates": 0
+        }
+
+    @classmethod
+    def from_library(cls, library: pd.DataFrame):
+        library = library.rename(columns=cls.LIBRARY_RENAME)
+        entries = library.reindex(columns=cls.KEY_COLUMNS + cls.VALUE_COLUMNS).dropna(subset=cls.KEY_COLUMNS)
+
+        # Deterministic tie-break between entries for the same key: most complete entry first, then file order
+        entries["completeness"] = entries[cls.VALUE_COLUMNS].notna().sum(axis=1)
+        entries["position"] = np.arange(len(entries))
+        entries = entries.sort_values(["completeness", "position"], ascending=[False, True], kind="stable")
+        duplicates = entries.groupby(cls.KEY_COLUMNS, sort=False).size() - 1
+        entries = entries.drop_duplicates(subset=cls.KEY_COLUMNS, keep="first").sort_values("position")
+        entries["Duplicates"] = duplicates.reindex(pd.MultiIndex.from_frame(entries[cls.KEY_COLUMNS])).to_numpy()
+        return cls(entries[cls.KEY_COLUMNS + cls.VALUE_COLUMNS + ["Duplicates"]])
+
+    @classmethod
+    def from_json(cls, library_tracks_file_path: str, cache: NormalizedCache = None):
+        # The de-duplicated index is cached under a hash of the library file
+        cache = cache or NormalizedCache()
+        cache_key = cache.key([library_tracks_file_path], cls.__name__, cls.VERSION)
+        entries = cache.load(cache_key)
+        if entries is not None:
+            return cls(entries)
+        index = cls.from_library(pd.read_json(library_tracks_file_path))
+        cache.store(cache_key, index.entries)
+        return index
+
+    def probe(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        # Inner join of an activity chunk against the index, at most one library entry per play
+        codes = self.keys.get_indexer(pd.MultiIndex.from_frame(chunk[self.KEY_COLUMNS]))
+        matched = codes >= 0
+        self.stats["plays_probed"] += len(codes)
+        self.stats["plays_matched"] += int(matched.sum())
+        self.stats["plays_missed"] += int((~matched).sum())
+        self.stats["plays_matching_duplicates"] += int(self._duplicated_key[codes[matched]].sum())
+
+        joined = chunk[matched].copy()
+        for column in self.VALUE_COLUMNS:
+            joined[column] = self.entries[column].to_numpy()[codes[matched]]
+        return joined
@@ -0,0 +1,151 @@
+import glob
+import os
+
+from os import environ, path
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from compact_schema import MS_PER_HOUR
+from parser_engine import COLUMNS_FOR_ANALYSIS, KEY_COLUMNS
+
+
+# Normalised plays as written to Parquet; Source tells the parsers' outputs apart once they are queried together
+PLAY_COLUMNS = COLUMNS_FOR_ANALYSIS + KEY_COLUMNS
+# Plays are sorted by Datetime before writing, so each row group covers a narrow time range and its min/max statistics
+# let DuckDB skip every row group outside a date filter. A multiple of DuckDB's 2048-row vectors.
+ROW_GROUP_SIZE = 122_880
+
+
+def write_parquet(df: pd.DataFrame, file_path: str, sort_column: str = "Datetime") -> int:
+    if sort_column in df.columns and not df[sort_column].is_monotonic_increasing:
+        df = df.sort_values(sort_column, kind="stable")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    os.makedirs(path.dirname(file_path), exist_ok=True)
+    # Written to a temporary file first so a query never reads a partial file
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE, compression="zstd")
+    os.replace(tmp_path, file_path)
+    return len(table)
+
+
+class ListeningSQL:
+    # Embedded DuckDB over a directory of Parquet files, one per source: `plays` is a view over all of them. Queries
+    # read only the columns they name and the row groups their filters can match, use every core, and spill to
+    # temp_directory past memory_limit, so nothing has to fit in a pandas frame first.
+    DEFAULT_DIR = path.join(path.expanduser("~"), ".cache", "music_analyser", "sql")
+
+    def __init__(self, directory: str = None, memory_limit: str = None, threads: int = None, temp_directory: str = None):
+        self.directory = directory or environ.get("LISTENING_SQL_DIR", self.DEFAULT_DIR)
+        self.connection = duckdb.connect()
+        self.connection.execute("SET enable_progress_bar = false")
+        if memory_limit:
+            self.connection.execute(f"SET memory_limit = '{memory_limit}'")
+        if threads:
+            self.connection.execute(f"SET threads = {int(threads)}")
+        self.connection.execute(f"SET temp_directory = '{temp_directory or path.join(self.directory, 'spill')}'")
+        self._create_views()
+
+    def _plays_path(self, name: str) -> str:
+        return path.join(self.directory, "plays", f"{name}.parquet")
+
+    def _create_views(self):
+        files = sorted(glob.glob(path.join(self.directory, "plays", "*.parquet")))
+        if files:
+            # union_by_name lets sources with different extra columns share the view, missing columns read as NULL
+            self.connection.execute(f"CREATE OR REPLACE VIEW plays AS SELECT * FROM read_parquet({files!r}, union_by_name = true)")
+
+    @property
+    def sources(self) -> list:
+        return sorted(path.splitext(path.basename(file))[0] for file in glob.glob(path.join(self.directory, "plays", "*.parquet")))
+
+    def add_frame(self, df: pd.DataFrame, name: str) -> int:
+        # Replaces the plays stored under `name`
+        rows = write_parquet(df.assign(Source=name), self._plays_path(name))
+        self._create_views()
+        return rows
+
+    def add_parser(self, parser, name: str = None) -> int:
+        return self.add_frame(parser.get_dataframe(PLAY_COLUMNS), name or parser.SOURCE_NAME)
+
+    def remove(self, name: str):
+        if path.exists(self._plays_path(name)):
+            os.remove(self._plays_path(name))
+        if self.sources:
+            self._create_views()
+        else:
+            self.connection.execute("DROP VIEW IF EXISTS plays")
+
+    def query(self, sql: str, parameters: list = None) -> pd.DataFrame:
+        return self.connection.execute(sql, parameters or []).df()
+
+    def explain(self, sql: str, parameters: list = None) -> str:
+        # Physical plan, showing the filters and columns pushed into the Parquet scan
+        return "\n".join(row[1] for row in self.connection.execute(f"EXPLAIN {sql}", parameters or []).fetchall())
+
+    @staticmethod
+    def _date_filter(start_date=None, end_date=None) -> tuple:
+        # Inclusive calendar dates, as returned by st.date_input, turned into a half-open Datetime range
+        clauses, parameters = [], []
+        if start_date is not None:
+            clauses.append('"Datetime" >= ?')
+            parameters.append(pd.Timestamp(start_date).normalize().to_pydatetime())
+        if end_date is not None:
+            clauses.append('"Datetime" < ?')
+            parameters.append((pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)).to_pydatetime())
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), parameters
+
+    def counts(self, column: str, start_date=None, end_date=None, limit: int = None) -> pd.Series:
+        # Plays per value of `column`, largest first
+        where, parameters = self._date_filter(start_date, end_date)
+        where = f"{where} {'AND' if where else 'WHERE'} \"{column}\" IS NOT NULL"
+        sql = f'SELECT "{column}", count(*) AS plays FROM plays {where} GROUP BY 1 ORDER BY plays DESC, 1'
+        counts = self.query(f"{sql} LIMIT {int(limit)}" if limit else sql, parameters)
+        return counts.set_index(column)["plays"]
+
+    def plays_per_hour(self, start_date=None, end_date=None) -> pd.DataFrame:
+        where, parameters = self._date_filter(start_date, end_date)
+        return self.query(f'SELECT hour("Datetime") AS hour, count(*) AS count FROM plays {where} GROUP BY 1 ORDER BY 1', parameters)
+
+    def hours_per_day_name(self, start_date=None, end_date=None) -> pd.DataFrame:
+        where, parameters = self._date_filter(start_date, end_date)
+        return self.query(f'SELECT dayname("Datetime") AS dayname, sum("Milliseconds played") / {MS_PER_HOUR} AS hours '
+                          f'FROM plays {where} GROUP BY 1 ORDER BY isodow(any_value("Datetime"))', parameters)
+
+    def plays_per_month(self, start_date=None, end_date=None) -> pd.DataFrame:
+        where, parameters = self._date_filter(start_date, end_date)
+        return self.query(f'SELECT monthname("Datetime") AS month, count(*) AS count FROM plays {where} '
+                          f'GROUP BY 1 ORDER BY month(any_value("Datetime"))', parameters)
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    from parser_engine import parse
+
+    # python listening_sql.py [spotify|apple] [parser arguments...], then an interactive SQL prompt over `plays`
+    sql = ListeningSQL()
+    if len(sys.argv) > 2:
+        # Spotify takes every history file as one list; Apple takes its three export files as separate arguments
+        parser = parse(sys.argv[1], sys.argv[2:]) if sys.argv[1] == "spotify" else parse(sys.argv[1], *sys.argv[2:])
+        print(f"{sql.add_parser(parser):,} {sys.argv[1]} plays written to {sql.directory}")
+    print(f"Sources: {', '.join(sql.sources) or 'none'}. Query the `plays` view; an empty line or end of input quits.")
+    while True:
+        try:
+            line = input("sql> ").strip()
+        except EOFError:
+            break
+        if not line:
+            break
+        start = time.perf_counter()
+        try:
+            print(sql.query(line).to_string(max_rows=50))
+        except duckdb.Error as error:
+            print(error)
+        print(f"({time.perf_counter() - start:.3f}s)")
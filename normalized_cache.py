@@ -0,0 +1,84 @@
+import hashlib
+import os
+
+from os import environ, path
+
+import pandas as pd
+import pyarrow as pa
+
+
+class NormalizedCache:
+    # Content-addressed store of parser output as uncompressed Arrow IPC files, memory-mapped on load
+    DEFAULT_DIR = path.join(path.expanduser("~"), ".cache", "music_analyser", "normalized")
+    HASH_BLOCK_SIZE = 1 << 20
+
+    def __init__(self, cache_dir: str = None, enabled: bool = True):
+        self.cache_dir = cache_dir or environ.get("NORMALIZED_CACHE_DIR", self.DEFAULT_DIR)
+        self.enabled = enabled
+
+    @classmethod
+    def file_digest(cls, input_file) -> str:
+        digest = hashlib.sha256()
+        if isinstance(input_file, (str, bytes)) or hasattr(input_file, "__fspath__"):
+            with open(input_file, "rb") as f:
+                for block in iter(lambda: f.read(cls.HASH_BLOCK_SIZE), b""):
+                    digest.update(block)
+        else:
+            # File-like objects (e.g. uploads) are rewound so the parser can still read them
+            position = input_file.tell()
+            for block in iter(lambda: input_file.read(cls.HASH_BLOCK_SIZE), b""):
+                digest.update(block if isinstance(block, bytes) else block.encode())
+            input_file.seek(position)
+        return digest.hexdigest()
+
+    def key(self, input_files: list, parser_name: str, schema_version: int) -> str:
+        # Any change to the inputs, the parser or its schema version produces a different key
+        digest = hashlib.sha256(f"{parser_name}:{schema_version}".encode())
+        for input_file in input_files:
+            digest.update(self.file_digest(input_file).encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return path.join(self.cache_dir, f"{key}.arrow")
+
+    def load(self, key: str):
+        if not self.enabled or not path.exists(self._path(key)):
+            return None
+        try:
+            with pa.memory_map(self._path(key), "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+        except (pa.ArrowInvalid, OSError):
+            return None
+        df = table.to_pandas()
+        # Arrow lists come back as numpy arrays; restore the Python lists the parsers produce
+        for field in table.schema:
+            if pa.types.is_list(field.type):
+                df[field.name] = table.column(field.name).to_pylist()
+        return df
+
+    def store(self, key: str, df: pd.DataFrame) -> bool:
+        if not self.enabled:
+            return False
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return False
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a partial cache entry
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, self._path(key))
+        return True
+
+    def remove(self, key: str):
+        if path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def clear(self):
+        if not path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".arrow"):
+                os.remove(path.join(self.cache_dir, name))
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from chart_data import ranking_figure
+
+
+class ParetoRanking:
+    # Values ranked by play count with a cumulative array, so any "top N% of listening" cutoff is one binary search
+    def __init__(self, counts: pd.Series):
+        self.counts = counts.sort_values(ascending=False, kind="stable")
+        self.cumulative = np.cumsum(self.counts.to_numpy())
+
+    @property
+    def total(self) -> int:
+        return int(self.cumulative[-1]) if len(self.cumulative) else 0
+
+    def cutoff(self, percent: float) -> int:
+        # Number of leading values whose cumulative plays stay under `percent` of the total
+        if percent >= 100:
+            return len(self.cumulative)
+        return int(np.searchsorted(self.cumulative, self.total * percent / 100, side="left"))
+
+    def top(self, percent: float) -> pd.Series:
+        return self.counts.iloc[:self.cutoff(percent)]
+
+    def figure(self, percent: float, x_label: str, title: str = None):
+        return ranking_figure(self.top(percent), x_label, title=title)
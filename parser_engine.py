@@ -0,0 +1,261 @@
+import importlib
+
+import pandas as pd
+
+from compact_schema import compact_dtypes
+from dimensions import Dimensions
+from genre_index import GenreIndex
+from instrumentation import ParseReport
+from normalized_cache import NormalizedCache
+from sessions import IDLE_GAP, Sessionizer
+
+
+COLUMNS_FOR_ANALYSIS = [
+    "Datetime",
+    "Day name",
+    "Day number",
+    "Month number",
+    "Year",
+    "Hour",
+    "Artist",
+    "Album name",
+    "Song name",
+    "Song and Artist name",
+    "Genre",
+    "Platform",
+    "Milliseconds played",
+    "End reason",
+    "Shuffle",
+    "Country",
+    "Latitude",
+    "Longitude"
+]
+
+# Columns every source must produce itself; everything else in COLUMNS_FOR_ANALYSIS is derived from these.
+# "Genre set" is categorical: each distinct set of tags is stored once, joined by genre_index.GENRE_SEPARATOR.
+BASE_COLUMNS = [
+    "Datetime",
+    "Artist",
+    "Album name",
+    "Song name",
+    "Genre set",
+    "Platform",
+    "Milliseconds played",
+    "End reason",
+    "Shuffle",
+    "Country",
+    "Latitude",
+    "Longitude"
+]
+
+# Names are stored once in the dimension tables; facts hold integer keys in their place
+NAME_COLUMNS = ["Artist", "Album name", "Song name"]
+KEY_COLUMNS = list(Dimensions.KEY_COLUMNS.values())
+FACT_COLUMNS = [column for column in BASE_COLUMNS if column not in NAME_COLUMNS] + KEY_COLUMNS
+
+DERIVED_COLUMNS = {}
+
+
+def derived_column(name: str):
+    def register(function):
+        DERIVED_COLUMNS[name] = function
+        return function
+    return register
+
+
+@derived_column("Day name")
+def _day_name(data):
+    return data["Datetime"].dt.day_name()
+
+
+@derived_column("Day number")
+def _day_number(data):
+    return data["Datetime"].dt.day
+
+
+@derived_column("Month number")
+def _month_number(data):
+    return data["Datetime"].dt.month
+
+
+@derived_column("Year")
+def _year(data):
+    return data["Datetime"].dt.year
+
+
+@derived_column("Hour")
+def _hour(data):
+    return data["Datetime"].dt.hour
+
+
+@derived_column("Artist")
+def _artist(data):
+    return data.dimensions.attribute("artist", data["Artist key"]).set_axis(data.base.index)
+
+
+@derived_column("Album name")
+def _album_name(data):
+    return data.dimensions.attribute("album", data["Album key"]).set_axis(data.base.index)
+
+
+@derived_column("Song name")
+def _song_name(data):
+    return data.dimensions.attribute("track", data["Track key"], "Song name").set_axis(data.base.index)
+
+
+@derived_column("Song and Artist name")
+def _song_and_artist_name(data):
+    # Built once per track in the dimension table, then gathered by key
+    if "Track key" not in data.base.columns:
+        return data["Song name"] + " | " + data["Artist"]
+    return data.dimensions.attribute("track", data["Track key"]).set_axis(data.base.index)
+
+
+@derived_column("Genre")
+def _genre(data):
+    # Per-play tag lists for consumers of the original layout; aggregations should use data.genres instead
+    return data.genres.lists().set_axis(data.base.index)
+
+
+class ListeningData:
+    # Base columns are held as parsed; derived columns are computed on first access and then kept,
+    # so a consumer that only reads Hour never pays for building "Song and Artist name".
+    # Names come from `dimensions` when the base holds integer keys instead of name columns.
+    def __init__(self, base: pd.DataFrame, dimensions: Dimensions = None):
+        self.base = base
+        self.dimensions = dimensions
+        self._derived = {}
+        self._genres = None
+
+    def __len__(self):
+        return len(self.base)
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.base.columns or column in DERIVED_COLUMNS
+
+    def __getitem__(self, column: str) -> pd.Series:
+        if column in self.base.columns:
+            return self.base[column]
+        if column not in self._derived:
+            if column not in DERIVED_COLUMNS:
+                raise KeyError(column)
+            values = DERIVED_COLUMNS[column](self).rename(column)
+            self._derived[column] = compact_dtypes(values.to_frame())[column]
+        return self._derived[column]
+
+    @property
+    def genres(self) -> GenreIndex:
+        # Interned genre ids and CSR genre sets, built on first use from the "Genre set" codes
+        if self._genres is None:
+            self._genres = GenreIndex(self.base["Genre set"])
+        return self._genres
+
+    @property
+    def materialized(self) -> list:
+        return list(self.base.columns) + list(self._derived)
+
+    def frame(self, columns: list = None) -> pd.DataFrame:
+        columns = columns or COLUMNS_FOR_ANALYSIS
+        return pd.DataFrame({column: self[column] for column in columns}, index=self.base.index)
+
+
+SOURCES = {}
+# Sources shipped with the repo, imported on first use so each registers itself
+BUILTIN_SOURCES = {
+    "spotify": "spotify_parser",
+    "apple": "apple_parser"
+}
+
+
+def register_source(name: str):
+    def register(parser_class):
+        parser_class.SOURCE_NAME = name
+        SOURCES[name] = parser_class
+        return parser_class
+    return register
+
+
+def get_source(name: str):
+    if name not in SOURCES and name in BUILTIN_SOURCES:
+        importlib.import_module(BUILTIN_SOURCES[name])
+    if name not in SOURCES:
+        raise KeyError(f"Unknown source {name!r}, expected one of {sorted(set(SOURCES) | set(BUILTIN_SOURCES))}")
+    return SOURCES[name]
+
+
+def parse(source: str, *args, **kwargs):
+    return get_source(source)(*args, **kwargs)
+
+
+class BaseParser:
+    # Shared engine: cache lookup, compact schema and lazily derived columns. Subclasses only implement
+    # _parse_base, returning BASE_COLUMNS for their own export format; names are then interned into self.dimensions
+    # and the stored facts hold FACT_COLUMNS.
+    SOURCE_NAME = None
+    # Bump whenever the normalised output changes so cached results are invalidated
+    SCHEMA_VERSION = 1
+    COLUMNS_FOR_ANALYSIS = COLUMNS_FOR_ANALYSIS
+    # Source-specific columns kept alongside BASE_COLUMNS, e.g. identifiers used for de-duplication
+    EXTRA_COLUMNS = []
+    # Whether Datetime is when a play started or when it ended, which decides where listening sessions begin
+    TIMESTAMP_MARKS = "start"
+
+    def __init__(self, input_files: list, normalized_cache: NormalizedCache = None):
+        # Every stage below, and any the source records in _parse_base, ends up in self.report
+        self.report = ParseReport(type(self).__name__)
+        self.normalized_cache = normalized_cache or NormalizedCache()
+        self.dimensions = Dimensions()
+        # Set to False by _parse_base when part of the result may differ next run, e.g. failed network lookups
+        self.complete = True
+        self.data = ListeningData(self._load_base(input_files), self.dimensions)
+        self._sessionizer = None
+
+    def _load_base(self, input_files: list) -> pd.DataFrame:
+        # A previously seen export is loaded straight from the normalised cache
+        with self.report.stage("cache_load") as stage:
+            cache_key = self.normalized_cache.key(input_files, type(self).__name__, self.SCHEMA_VERSION)
+            base = self.normalized_cache.load(cache_key)
+            dimensions = None if base is None else Dimensions.load(self.normalized_cache, cache_key)
+            if dimensions is not None:
+                self.dimensions = dimensions
+            else:
+                base = None
+            stage["rows_out"] = None if base is None else len(base)
+        self.report.cache_hit = base is not None
+        if base is None:
+            base = self._compact_base(self._parse_base())
+            # An incomplete result is not stored, so the next run parses again instead of keeping the gaps until a
+            # schema bump
+            if self.complete:
+                with self.report.stage("cache_store", rows_in=len(base)):
+                    self.normalized_cache.store(cache_key, base)
+                    self.dimensions.store(self.normalized_cache, cache_key)
+        return base
+
+    def _compact_base(self, parsed: pd.DataFrame) -> pd.DataFrame:
+        # Tracks, artists and albums are interned into self.dimensions, which keeps ids assigned by earlier parses
+        with self.report.stage("intern_dimensions", rows_in=len(parsed)) as stage:
+            parsed = parsed.reset_index(drop=True)
+            keys = self.dimensions.assign(parsed)
+            stage["rows_out"] = len(self.dimensions.tables["track"])
+        with self.report.stage("compact_dtypes", rows_in=len(parsed)) as stage:
+            columns = [column for column in FACT_COLUMNS if column not in KEY_COLUMNS] + self.EXTRA_COLUMNS
+            base = compact_dtypes(pd.concat([parsed[columns], keys], axis=1))
+            stage["rows_out"] = len(base)
+        return base
+
+    def _parse_base(self) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def get_dataframe(self, columns: list = None) -> pd.DataFrame:
+        return self.data.frame(columns)
+
+    def sessions(self, idle_gap: pd.Timedelta = IDLE_GAP) -> pd.DataFrame:
+        # Sorted once on first use; any idle gap after that only re-cuts the same sorted plays
+        if self._sessionizer is None:
+            self._sessionizer = Sessionizer(self.data, timestamp_marks=self.TIMESTAMP_MARKS)
+        return self._sessionizer.sessions(idle_gap)
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self.get_dataframe()
@@ -0,0 +1,196 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from compact_schema import DAY_NAMES, MS_PER_HOUR
+from discovery import DiscoveryIndex
+from pareto import ParetoRanking
+from time_index import TimeIndex
+from timestamps import naive_datetimes
+
+
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June",
+               "July", "August", "September", "October", "November", "December"]
+RANKING_CACHE_SIZE = 32
+
+
+class RollupCube:
+    # Pre-aggregated play counts and ms sums, built once per dataset so charts never re-group the raw rows.
+    # The time cube is day x hour; each dimension cube is day x value. Each is sorted by day behind a TimeIndex.
+    # Tracks, artists and albums are aggregated on their integer keys and only named when a chart asks for them.
+    DIMENSIONS = {
+        "artist": "Artist key",
+        "album": "Album key",
+        "track": "Track key",
+        "platform": "Platform",
+        "country": "Country"
+    }
+
+    def __init__(self, df: pd.DataFrame, datetime_column: str = "Datetime", ms_column: str = "Milliseconds played",
+                 dimensions: dict = None, discovery_dimension: str = "track", labels: dict = None):
+        # `labels` maps a key column to the name of every key (Dimensions.labels()); a ListeningData supplies its own
+        self.dimensions = dimensions or self.DIMENSIONS
+        self.datetime_column = datetime_column
+        self.ms_column = ms_column
+        self.discovery_dimension = discovery_dimension
+
+        # Each play is labelled first-listen or repeat against the whole history before anything is aggregated
+        self.discovery = DiscoveryIndex()
+        self.labels = {}
+        self._update_labels(df, labels)
+        time_cube, dimension_cubes = self._aggregate_plays(df)
+        self.time = TimeIndex(time_cube, "date", presorted=True)
+        self.cubes = {name: TimeIndex(cube, "date", presorted=True) for name, cube in dimension_cubes.items()}
+        self._rankings = {}
+
+    def _update_labels(self, df, labels: dict = None):
+        # Dimension tables only ever grow, so the latest labels cover every key already in the cubes
+        dimensions = getattr(df, "dimensions", None)
+        labels = labels or (dimensions.labels() if dimensions is not None else {})
+        self.labels.update({name: labels[column] for name, column in self.dimensions.items() if column in labels})
+
+    def _aggregate_plays(self, df) -> tuple:
+        # `df` only needs item access by column name, so a ListeningData works as well as a DataFrame
+        datetimes = naive_datetimes(df[self.datetime_column])
+        discovery_codes = self.discovery.update(df[self.dimensions[self.discovery_dimension]], datetimes)
+
+        base = pd.DataFrame({
+            "date": datetimes.dt.normalize(),
+            "hour": datetimes.dt.hour.astype("int8"),
+            "ms": df[self.ms_column],
+            "discovered": self.discovery.classify(discovery_codes, datetimes)
+        })
+        time_cube = self._aggregate(base, ["date", "hour"])
+        # Discoveries are only tracked on the time cube, which is the one discoveries_per_day reads
+        base = base.drop(columns="discovered")
+        dimension_cubes = {}
+        for name, column in self.dimensions.items():
+            base[name] = df[column]
+            dimension_cubes[name] = self._aggregate(base, ["date", name])
+            base.drop(columns=name, inplace=True)
+        return time_cube, dimension_cubes
+
+    @staticmethod
+    def _aggregate(base: pd.DataFrame, keys: list) -> pd.DataFrame:
+        aggregations = {"plays": ("ms", "size"), "ms": ("ms", "sum")}
+        if "discovered" in base.columns:
+            aggregations["discoveries"] = ("discovered", "sum")
+        cube = base.groupby(keys, observed=True, sort=True).agg(**aggregations)
+        return cube.reset_index()
+
+    @staticmethod
+    def _merge(existing: pd.DataFrame, delta: pd.DataFrame, keys: list) -> pd.DataFrame:
+        # New exports mostly add later days, which only need appending; overlapping days are summed per key
+        if not len(existing) or not len(delta) or delta["date"].iloc[0] > existing["date"].iloc[-1]:
+            return pd.concat([existing, delta], ignore_index=True)
+        merged = pd.concat([existing, delta], ignore_index=True)
+        return merged.groupby(keys, observed=True, sort=True).sum().reset_index()
+
+    def update(self, df, labels: dict = None):
+        # Folds new plays into the cubes without touching the existing ones, so a refresh costs time in the delta
+        self._update_labels(df, labels)
+        previous_first_seen = self.discovery.first_seen.copy()
+        time_cube, dimension_cubes = self._aggregate_plays(df)
+
+        # A new play older than a track's known first play takes over the discovery; the old one becomes a repeat
+        moved = np.flatnonzero(self.discovery.first_seen[:len(previous_first_seen)] < previous_first_seen)
+        if len(moved):
+            old_times = pd.Series(pd.to_datetime(previous_first_seen[moved])).astype(self.time.df["date"].dtype)
+            corrections = pd.DataFrame({"date": old_times.dt.normalize(), "hour": old_times.dt.hour.astype("int8"),
+                                        "plays": 0, "ms": 0, "discoveries": -1})
+            corrections = corrections.groupby(["date", "hour"], sort=True).sum().reset_index()
+            time_cube = self._merge(corrections, time_cube, ["date", "hour"])
+
+        self.time = TimeIndex(self._merge(self.time.df, time_cube, ["date", "hour"]), "date", presorted=True)
+        for name, cube in dimension_cubes.items():
+            self.cubes[name] = TimeIndex(self._merge(self.cubes[name].df, cube, ["date", name]), "date", presorted=True)
+        self._rankings = {}
+
+    def save(self, directory: str):
+        # Cubes and the discovery index as Feather files, so a stored history reloads without re-aggregating
+        os.makedirs(directory, exist_ok=True)
+        self.time.df.to_feather(os.path.join(directory, "time.feather"))
+        for name, cube in self.cubes.items():
+            cube.df.to_feather(os.path.join(directory, f"dimension_{name}.feather"))
+        for name, labels in self.labels.items():
+            labels.rename("label").to_frame().to_feather(os.path.join(directory, f"labels_{name}.feather"))
+        discovery = pd.DataFrame({"key": self.discovery.keys, "first_seen": self.discovery.first_seen})
+        discovery.to_feather(os.path.join(directory, "discovery.feather"))
+        with open(os.path.join(directory, "rollup.json"), "w") as f:
+            json.dump({"dimensions": self.dimensions, "datetime_column": self.datetime_column, "ms_column": self.ms_column,
+                       "discovery_dimension": self.discovery_dimension}, f)
+
+    @classmethod
+    def load(cls, directory: str):
+        with open(os.path.join(directory, "rollup.json")) as f:
+            settings = json.load(f)
+        cube = cls.__new__(cls)
+        cube.__dict__.update(settings)
+        cube.time = TimeIndex(pd.read_feather(os.path.join(directory, "time.feather")), "date", presorted=True)
+        cube.cubes = {
+            name: TimeIndex(pd.read_feather(os.path.join(directory, f"dimension_{name}.feather")), "date", presorted=True)
+            for name in cube.dimensions
+        }
+        cube.labels = {
+            name: pd.read_feather(os.path.join(directory, f"labels_{name}.feather"))["label"]
+            for name in cube.dimensions if os.path.exists(os.path.join(directory, f"labels_{name}.feather"))
+        }
+        discovery = pd.read_feather(os.path.join(directory, "discovery.feather"))
+        cube.discovery = DiscoveryIndex()
+        cube.discovery.keys = pd.Index(discovery["key"])
+        cube.discovery.first_seen = np.array(discovery["first_seen"], dtype="int64")
+        cube._rankings = {}
+        return cube
+
+    def date_bounds(self):
+        first, last = self.time.bounds()
+        return first.date(), last.date()
+
+    def counts(self, dimension: str, start_date=None, end_date=None) -> pd.Series:
+        rows = self.cubes[dimension].slice(start_date, end_date)
+        counts = rows.groupby(dimension, observed=True, sort=False)["plays"].sum()
+        if dimension in self.labels:
+            # Keys are named only after grouping; -1 is a play without a name, and keys sharing a label are shown as one
+            counts = counts[counts.index >= 0]
+            names = self.labels[dimension].array.take(counts.index.to_numpy())
+            counts = counts.groupby(names, sort=False).sum().rename_axis(dimension)
+        return counts[counts > 0].sort_values(ascending=False, kind="stable")
+
+    def ranking(self, dimension: str, start_date=None, end_date=None) -> ParetoRanking:
+        # Ranked once per (dimension, date range); changing only the percentage cutoff reuses it
+        key = (dimension, start_date, end_date)
+        if key not in self._rankings:
+            if len(self._rankings) >= RANKING_CACHE_SIZE:
+                self._rankings.pop(next(iter(self._rankings)))
+            self._rankings[key] = ParetoRanking(self.counts(dimension, start_date, end_date))
+        return self._rankings[key]
+
+    def top(self, dimension: str, start_date=None, end_date=None):
+        counts = self.ranking(dimension, start_date, end_date).counts
+        return counts.index[0] if len(counts) else None
+
+    def plays_per_hour(self, start_date=None, end_date=None) -> pd.DataFrame:
+        rows = self.time.slice(start_date, end_date)
+        return rows.groupby("hour")["plays"].sum().rename("count").reset_index()
+
+    def hours_per_day_name(self, start_date=None, end_date=None) -> pd.DataFrame:
+        rows = self.time.slice(start_date, end_date)
+        hours = rows.groupby(rows["date"].dt.day_name())["ms"].sum() / MS_PER_HOUR
+        return hours.rename("hours").rename_axis("dayname").reset_index()
+
+    def plays_per_month(self, start_date=None, end_date=None) -> pd.DataFrame:
+        rows = self.time.slice(start_date, end_date)
+        plays = rows.groupby(rows["date"].dt.month_name())["plays"].sum()
+        return plays.rename("count").rename_axis("month").reset_index()
+
+    def discoveries_per_day(self, start_date=None, end_date=None) -> pd.DataFrame:
+        # Discoveries are first plays across the whole history, so narrowing the range never relabels a repeat
+        rows = self.time.slice(start_date, end_date)
+        daily = rows.groupby("date")[["plays", "discoveries"]].sum()
+        return pd.DataFrame({
+            "date": daily.index,
+            "Discovered": daily["discoveries"].to_numpy(),
+            "Repeated": (daily["plays"] - daily["discoveries"]).to_numpy()
+        })
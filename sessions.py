@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+from timestamps import datetime_ticks
+
+
+IDLE_GAP = pd.Timedelta(minutes=30)
+# Normalised end reasons that mean the listener moved on before the track finished
+SKIP_REASONS = ["forward_button", "back_button", "selected_diff_item"]
+SESSION_LENGTH_BINS = [0, 5, 10, 15, 30, 45, 60, 90, 120, 180, 240, 360, 480, np.inf]
+
+
+class Sessionizer:
+    # Splits plays into listening sessions wherever the listener was idle for longer than idle_gap. One stable sort,
+    # then boundaries, ids and every per-session aggregate are whole-array operations over the sorted plays.
+    def __init__(self, df, datetime_column: str = "Datetime", ms_column: str = "Milliseconds played",
+                 end_reason_column: str = "End reason", platform_column: str = "Platform", timestamp_marks: str = "start",
+                 skip_reasons: list = None):
+        # timestamp_marks says whether the datetime column is when a play started (Apple) or ended (Spotify's ts);
+        # skip_reasons defaults to the normalised values, raw exports pass their own codes
+        ms = df[ms_column].to_numpy(dtype="int64")
+        marks = datetime_ticks(df[datetime_column])
+        starts = marks - ms * 1_000_000 if timestamp_marks == "end" else marks
+        self.order = np.argsort(starts, kind="stable")
+        self.starts = starts[self.order]
+        self.ms = ms[self.order]
+        self.ends = self.starts + self.ms * 1_000_000
+        self.skipped = pd.Series(df[end_reason_column]).isin(SKIP_REASONS if skip_reasons is None else skip_reasons).to_numpy()[self.order]
+        # Platforms as small integer codes (-1 when missing) so the dominant one per session is a bincount
+        codes, self.platform_names = pd.factorize(pd.Series(df[platform_column]).to_numpy(dtype=object))
+        self.platform_codes = codes[self.order]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def session_ids(self, idle_gap: pd.Timedelta = IDLE_GAP) -> np.ndarray:
+        # Session id per play, in the original row order
+        if not len(self):
+            return np.empty(0, dtype="int64")
+        # Idle time before each play is measured from the latest end so far, so overlapping plays never split a session
+        latest_end = np.maximum.accumulate(self.ends)
+        boundary = np.empty(len(self), dtype=bool)
+        boundary[0] = True
+        boundary[1:] = self.starts[1:] - latest_end[:-1] > pd.Timedelta(idle_gap).value
+        ids = np.empty(len(self), dtype="int64")
+        ids[self.order] = np.cumsum(boundary) - 1
+        return ids
+
+    def sessions(self, idle_gap: pd.Timedelta = IDLE_GAP) -> pd.DataFrame:
+        # One row per session: start, end, duration, tracks, listening time, skips and the most used platform
+        if not len(self):
+            # Same dtypes as a non-empty result, so .dt and numeric aggregates still work on it
+            no_times = pd.DatetimeIndex(np.empty(0, dtype="datetime64[ns]"))
+            return pd.DataFrame({
+                "start": no_times,
+                "end": no_times,
+                "duration_minutes": np.empty(0),
+                "tracks": np.empty(0, dtype="int64"),
+                "listening_minutes": np.empty(0),
+                "skips": np.empty(0, dtype="int64"),
+                "skip_rate": np.empty(0),
+                "platform": pd.Series([], dtype="str"),
+                "start_hour": no_times.hour
+            }).rename_axis("session")
+        sorted_ids = self.session_ids(idle_gap)[self.order]
+        first = np.flatnonzero(np.diff(sorted_ids, prepend=-1))
+        tracks = np.diff(np.append(first, len(self)))
+        start = self.starts[first]
+        end = np.maximum.reduceat(self.ends, first)
+        skips = np.add.reduceat(self.skipped.astype("int64"), first)
+
+        # Dominant platform: plays per (session, platform) pair counted in one bincount, then the largest per session
+        known = self.platform_codes >= 0
+        width = max(len(self.platform_names), 1)
+        pairs = np.bincount(sorted_ids[known] * width + self.platform_codes[known], minlength=len(first) * width)
+        pairs = pairs.reshape(len(first), width)
+        platform = np.append(np.asarray(self.platform_names, dtype=object), None)[np.where(pairs.any(axis=1), pairs.argmax(axis=1), -1)]
+
+        start_times = pd.to_datetime(start)
+        return pd.DataFrame({
+            "start": start_times,
+            "end": pd.to_datetime(end),
+            "duration_minutes": (end - start) / 60e9,
+            "tracks": tracks,
+            "listening_minutes": np.add.reduceat(self.ms, first) / 60_000,
+            "skips": skips,
+            "skip_rate": skips / tracks,
+            "platform": platform,
+            "start_hour": start_times.hour
+        }).rename_axis("session")
+
+
+def session_length_distribution(sessions: pd.DataFrame) -> pd.DataFrame:
+    # Sessions per duration bucket, ready for a bar chart
+    counts, _ = np.histogram(sessions["duration_minutes"], bins=SESSION_LENGTH_BINS)
+    labels = [f"{int(low)}-{int(high)}" if np.isfinite(high) else f"{int(low)}+" for low, high in zip(SESSION_LENGTH_BINS, SESSION_LENGTH_BINS[1:])]
+    return pd.DataFrame({"minutes": labels, "sessions": counts})
+
+
+def sessions_by_hour(sessions: pd.DataFrame) -> pd.DataFrame:
+    counts = np.bincount(sessions["start_hour"].to_numpy(dtype="int64"), minlength=24)
+    return pd.DataFrame({"hour": np.arange(24), "sessions": counts})
+
+
+if __name__ == '__main__':
+    import time
+
+    rows = 5_000_000
+    rng = np.random.default_rng(0)
+    # Bursts of back-to-back plays separated by idle gaps of minutes to days
+    ms = rng.integers(10_000, 300_000, rows)
+    idle = np.where(rng.random(rows) < 0.02, rng.integers(30 * 60_000, 86_400_000, rows), rng.integers(0, 60_000, rows))
+    ends = pd.to_datetime("2015-01-01") + pd.to_timedelta(np.cumsum(ms + idle), unit="ms")
+    df = pd.DataFrame({
+        "ts": ends,
+        "ms_played": ms,
+        "End reason": rng.choice(["track_done", "forward_button", "pause"], rows, p=[0.7, 0.2, 0.1]),
+        "Platform": rng.choice(["ios", "android", "osx"], rows)
+    }).sample(frac=1, random_state=0)
+
+    start = time.perf_counter()
+    sessionizer = Sessionizer(df, datetime_column="ts", ms_column="ms_played", timestamp_marks="end")
+    sessions = sessionizer.sessions()
+    print(f"{rows:,} plays -> {len(sessions):,} sessions in {time.perf_counter() - start:.2f}s")
+    print(sessions.describe().T[["mean", "50%", "max"]])
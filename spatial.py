@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+
+from compact_schema import MS_PER_HOUR
+from normalization import COUNTRY_CENTROIDS
+
+
+GEOHASH_ALPHABET = np.array(list("0123456789bcdefghjkmnpqrstuvwxyz"))
+# Plays are encoded once at this precision (~150m cells); coarser grids are bit shifts of the same codes
+MAX_PRECISION = 7
+# Map zoom level -> geohash precision giving cells of a few pixels to a few dozen pixels across
+ZOOM_PRECISION = [1, 1, 2, 2, 3, 3, 3, 4, 4, 4, 5, 5, 5, 6, 6, 6, 7]
+METRES_PER_DEGREE = 111_320
+
+_CENTROID_CODES = pd.Index(list(COUNTRY_CENTROIDS))
+# One trailing NaN slot for codes without a centroid (index -1)
+_CENTROID_LATITUDES = np.append(np.array([lat for lat, _ in COUNTRY_CENTROIDS.values()]), np.nan)
+_CENTROID_LONGITUDES = np.append(np.array([lon for _, lon in COUNTRY_CENTROIDS.values()]), np.nan)
+
+
+def country_coordinates(country_codes: pd.Series) -> tuple:
+    # (latitudes, longitudes) of each ISO 3166 alpha-2 code's centroid, NaN for missing or unknown codes
+    positions = _CENTROID_CODES.get_indexer(country_codes)
+    return _CENTROID_LATITUDES[positions], _CENTROID_LONGITUDES[positions]
+
+
+def precision_for_zoom(zoom: int) -> int:
+    return ZOOM_PRECISION[int(np.clip(zoom, 0, len(ZOOM_PRECISION) - 1))]
+
+
+def _bits(precision: int) -> tuple:
+    # A geohash interleaves longitude and latitude bits, longitude first, 5 bits per character
+    total = 5 * precision
+    return (total + 1) // 2, total // 2
+
+
+def _spread(values: np.ndarray) -> np.ndarray:
+    # Moves bit i of each value to bit 2i (Morton interleaving), a handful of whole-array operations
+    values = values.astype("uint64")
+    for shift, mask in [(16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)]:
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def _compact(values: np.ndarray) -> np.ndarray:
+    # Inverse of _spread: gathers bits 0, 2, 4, ... back together
+    values = values.astype("uint64") & np.uint64(0x5555555555555555)
+    for shift, mask in [(1, 0x3333333333333333), (2, 0x0F0F0F0F0F0F0F0F), (4, 0x00FF00FF00FF00FF),
+                        (8, 0x0000FFFF0000FFFF), (16, 0x00000000FFFFFFFF)]:
+        values = (values | (values >> np.uint64(shift))) & np.uint64(mask)
+    return values.astype("int64")
+
+
+def encode(latitudes: np.ndarray, longitudes: np.ndarray, precision: int = MAX_PRECISION) -> np.ndarray:
+    # Integer geohash codes, computed in bulk; -1 where a coordinate is missing
+    lon_bits, lat_bits = _bits(precision)
+    valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+    lat = np.clip((np.nan_to_num(latitudes) + 90) / 180, 0, 1 - 1e-12)
+    lon = np.clip((np.nan_to_num(longitudes) + 180) / 360, 0, 1 - 1e-12)
+    lat_cells = _spread((lat * (1 << lat_bits)).astype("int64"))
+    lon_cells = _spread((lon * (1 << lon_bits)).astype("int64"))
+    # The most significant bit is always longitude, so with an odd bit count longitude takes the even positions
+    if lon_bits > lat_bits:
+        codes = lon_cells | (lat_cells << np.uint64(1))
+    else:
+        codes = (lon_cells << np.uint64(1)) | lat_cells
+    return np.where(valid, codes.astype("int64"), -1)
+
+
+def decode(codes: np.ndarray, precision: int) -> tuple:
+    # (latitude, longitude) of each cell's centre
+    lon_bits, lat_bits = _bits(precision)
+    codes = codes.astype("uint64")
+    if lon_bits > lat_bits:
+        lon_cells, lat_cells = _compact(codes), _compact(codes >> np.uint64(1))
+    else:
+        lon_cells, lat_cells = _compact(codes >> np.uint64(1)), _compact(codes)
+    latitudes = (lat_cells + 0.5) / (1 << lat_bits) * 180 - 90
+    longitudes = (lon_cells + 0.5) / (1 << lon_bits) * 360 - 180
+    return latitudes, longitudes
+
+
+def to_strings(codes: np.ndarray, precision: int) -> np.ndarray:
+    # Base32 text form, only ever applied to the (few) aggregated cells
+    characters = [GEOHASH_ALPHABET[(codes >> (5 * (precision - 1 - i))) & 31] for i in range(precision)]
+    return np.array(["".join(chars) for chars in zip(*characters)], dtype=object) if len(codes) else np.empty(0, dtype=object)
+
+
+class SpatialBins:
+    # Plays binned on a geohash grid. Codes are computed once at MAX_PRECISION; any coarser grid is a right shift
+    # followed by a segmented sum, so changing zoom never re-reads coordinates.
+    def __init__(self, df: pd.DataFrame, latitude_column: str = "Latitude", longitude_column: str = "Longitude",
+                 ms_column: str = "Milliseconds played"):
+        codes = encode(df[latitude_column].to_numpy(dtype="float64"), df[longitude_column].to_numpy(dtype="float64"))
+        located = codes >= 0
+        # Sorted once: shifting keeps the order, so every coarser grid is a run-length reduction with no re-sort
+        order = np.argsort(codes[located], kind="stable")
+        self.codes = codes[located][order]
+        self.ms = df[ms_column].to_numpy(dtype="int64")[located][order]
+        self.unlocated = int((~located).sum())
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _cell_starts(self, precision: int) -> tuple:
+        codes = self.codes >> (5 * (MAX_PRECISION - precision))
+        starts = np.flatnonzero(np.diff(codes, prepend=-1)) if len(codes) else np.empty(0, dtype="int64")
+        return codes[starts], starts
+
+    def cells(self, precision: int = None, zoom: int = None) -> pd.DataFrame:
+        # One row per occupied cell with its centre, geohash, plays and listening hours
+        precision = precision or (precision_for_zoom(zoom) if zoom is not None else MAX_PRECISION)
+        cells, starts = self._cell_starts(precision)
+        latitudes, longitudes = decode(cells, precision)
+        return pd.DataFrame({
+            "geohash": to_strings(cells, precision),
+            "latitude": latitudes,
+            "longitude": longitudes,
+            "plays": np.diff(np.append(starts, len(self.codes))),
+            "hours": np.add.reduceat(self.ms, starts) / MS_PER_HOUR if len(starts) else np.empty(0),
+            # Half the cell's north-south extent, a natural maximum marker radius for this grid
+            "cell_radius_m": 90 / (1 << _bits(precision)[1]) * METRES_PER_DEGREE
+        })
+
+    def adaptive(self, max_cells: int = 5000) -> pd.DataFrame:
+        # Finest grid that still stays within max_cells, so the browser only ever receives a bounded number of points
+        for precision in range(MAX_PRECISION, 0, -1):
+            if len(self._cell_starts(precision)[1]) <= max_cells:
+                return self.cells(precision)
+        return self.cells(1)
+
+
+if __name__ == '__main__':
+    import time
+
+    rows = 5_000_000
+    rng = np.random.default_rng(0)
+    cities = np.array([(51.5, -0.1), (40.7, -74.0), (48.9, 2.4), (35.7, 139.7), (-33.9, 151.2)])
+    city = rng.integers(0, len(cities), rows)
+    df = pd.DataFrame({
+        "Latitude": cities[city, 0] + rng.normal(0, 0.5, rows),
+        "Longitude": cities[city, 1] + rng.normal(0, 0.5, rows),
+        "Milliseconds played": rng.integers(0, 300_000, rows)
+    })
+    start = time.perf_counter()
+    bins = SpatialBins(df)
+    encoded = time.perf_counter() - start
+    for zoom in [2, 6, 10]:
+        start = time.perf_counter()
+        cells = bins.cells(zoom=zoom)
+        print(f"zoom {zoom}: {len(cells):,} cells from {rows:,} plays in {time.perf_counter() - start:.3f}s")
+    print(f"encoding {rows:,} plays took {encoded:.2f}s; adaptive grid has {len(bins.adaptive()):,} cells")
+    print(country_coordinates(pd.Series(["GB", "US", None, "ZZ"])))
@@ -1,54 +1,130 @@
+import hashlib
 import json
+import os
+import tempfile
+
+import duckdb
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 from streamlit_lottie import st_lottie
 
+from chart_data import histogram_figure, time_histogram
+from dimensions import Dimensions
+from instrumentation import ParseReport, show_report
+from listening_sql import ListeningSQL
+from rollup import DAY_NAMES, MONTH_NAMES, RollupCube
+from sessions import Sessionizer, session_length_distribution, sessions_by_hour
+from spotify_parser import SpotifyParser
+from time_index import TimeIndex
+from upload_ingest import ingest_uploads
+
+CUBE_DIMENSIONS = {
+    "artist": "Artist key",
+    "album": "Album key",
+    "track": "Track key",
+    "platform": "platform",
+    "country": "conn_country"
+}
+# Raw reason_end codes counted as skips when splitting listening sessions
+SKIP_REASON_CODES = ["fwdbtn", "backbtn"]
+# Uploads are queried under the parsers' column names
+SQL_COLUMNS = {"datetime": "Datetime", **SpotifyParser.RENAME_COLUMNS}
+DEFAULT_SQL = """SELECT "Artist", count(*) AS plays, round(sum("Milliseconds played") / 3600000, 1) AS hours
+FROM plays
+GROUP BY 1
+ORDER BY plays DESC
+LIMIT 20"""
+
 
 def load_lottiefile(filepath):
     with open(filepath) as f:
         return json.load(f)
 
 
+def listening_sql(dataset_key, df) -> ListeningSQL:
+    # Each set of uploads is written to Parquet once, on the first query, and DuckDB reads it from there
+    if st.session_state.get("sql_dataset_key") != dataset_key:
+        directory = os.path.join(tempfile.gettempdir(), "music_analyser_sql", hashlib.sha256(repr(dataset_key).encode()).hexdigest()[:16])
+        sql = ListeningSQL(directory)
+        columns = [column for column in list(SQL_COLUMNS) + list(Dimensions.KEY_COLUMNS.values()) if column in df.columns]
+        sql.add_frame(df[columns].rename(columns=SQL_COLUMNS), "spotify")
+        st.session_state.update(sql_dataset_key=dataset_key, sql=sql)
+    return st.session_state["sql"]
+
+
+def pareto_chart(heading, ranking, key, x_label):
+    st.write(heading)
+    percent = st.selectbox("Top %", [25, 50, 75, 100], index=3, key=key)
+    st.plotly_chart(ranking.figure(percent, x_label))
+
+
 lottie_animation = load_lottiefile("animations/music_visualiser.json")
 st_lottie(lottie_animation)
 st.title(":notes: Visualise your Spotify data :bar_chart:")
 
 uploaded_file = st.file_uploader("Add your data", accept_multiple_files=True)
 if uploaded_file:
-    if isinstance(uploaded_file, list):
-        df = pd.DataFrame()
-        for file in uploaded_file:
-            tmp_df = pd.read_json(file)
-            df = pd.concat([tmp_df, df], axis=0)
-        df_created = True
-    else:
-        df = pd.read_json(uploaded_file)
-        df_created = True
+    uploaded_files = uploaded_file if isinstance(uploaded_file, list) else [uploaded_file]
+    # Parsing and aggregation happen once per set of uploads, not on every widget interaction
+    dataset_key = tuple(getattr(file, "file_id", file.name) for file in uploaded_files)
+    if st.session_state.get("dataset_key") != dataset_key:
+        report = ParseReport("Dashboard")
+        # Files are parsed in parallel and concatenated once
+        with report.stage("ingest_uploads") as stage:
+            df, ingest_timings = ingest_uploads(uploaded_files)
+            stage["rows_out"] = len(df)
+        with report.stage("normalise", rows_in=len(df)) as stage:
+            df["datetime"] = pd.to_datetime(df["ts"], format="%Y-%m-%dT%H:%M:%SZ")
+            stage["rows_out"] = len(df)
+        # Tracks (by URI), artists and albums become integer keys; names are only looked up for the charts
+        with report.stage("intern_dimensions", rows_in=len(df)) as stage:
+            dimensions = Dimensions()
+            keys = dimensions.assign(df, song_column="master_metadata_track_name", artist_column="master_metadata_album_artist_name",
+                                     album_column="master_metadata_album_album_name", uri_column="spotify_track_uri")
+            df = pd.concat([df, keys], axis=1)
+            stage["rows_out"] = len(dimensions.tables["track"])
+        # Plays are kept sorted by time so date ranges are binary-searched slices
+        with report.stage("time_index", rows_in=len(df)) as stage:
+            time_index = TimeIndex(df, "datetime")
+            df = time_index.df
+            stage["rows_out"] = len(df)
+        with report.stage("rollup", rows_in=len(df)) as stage:
+            cube = RollupCube(df, datetime_column="datetime", ms_column="ms_played", dimensions=CUBE_DIMENSIONS, labels=dimensions.labels())
+            stage["rows_out"] = len(cube.time)
+        # ts is when each play ended; plays are sorted by start once here and re-cut for whichever idle gap is chosen
+        with report.stage("sessions", rows_in=len(df)) as stage:
+            sessionizer = Sessionizer(df, datetime_column="datetime", ms_column="ms_played", end_reason_column="reason_end",
+                                      platform_column="platform", timestamp_marks="end", skip_reasons=SKIP_REASON_CODES)
+            stage["rows_out"] = len(sessionizer)
+        st.session_state.update(dataset_key=dataset_key, df=df, time_index=time_index, cube=cube, sessionizer=sessionizer,
+                                ingest_timings=ingest_timings, report=report)
+    df = st.session_state["df"]
+    time_index = st.session_state["time_index"]
+    cube = st.session_state["cube"]
+    sessionizer = st.session_state["sessionizer"]
+    with st.expander("File loading times :stopwatch:"):
+        st.dataframe(st.session_state["ingest_timings"])
+    if st.sidebar.checkbox("Show processing report"):
+        show_report(st.session_state["report"])
+    df_created = True
 else:
     df_created = False
 
 if df_created:
-    # df = pd.read_json(uploaded_file)
-    df["datetime"] = pd.to_datetime(df["ts"], format="%Y-%m-%dT%H:%M:%SZ")
-    df["dayname"] = df["datetime"].dt.day_name()
-    df["hour"] = df["datetime"].dt.hour
-    df["month"] = df["datetime"].dt.month_name()
-    df["master_metadata_track_name"] = df["master_metadata_track_name"] + " | " + df["master_metadata_album_artist_name"]
     st.dataframe(df.head())
 
     st.write("### Select Date Range")
-    min_date = df["datetime"].min().date()
-    max_date = df["datetime"].max().date()
+    min_date, max_date = cube.date_bounds()
     start_date, end_date = st.date_input("Date range", [min_date, max_date], min_value=min_date, max_value=max_date)
-
-    mask = (df["datetime"].dt.date >= start_date) & (df["datetime"].dt.date <= end_date)
-    df_date_filtered = df[mask]
+    df_date_filtered = time_index.slice(start_date, end_date)
+    st.write(f"{len(df_date_filtered):,} plays between {start_date} and {end_date}")
 
     st.write("### Overall Stats :bar_chart:")
-    top_artist = df_date_filtered["master_metadata_album_artist_name"].mode()[0]
-    top_album = df_date_filtered["master_metadata_album_album_name"].mode()[0]
-    top_track = df_date_filtered["master_metadata_track_name"].mode()[0]
+    top_artist = cube.top("artist", start_date, end_date)
+    top_album = cube.top("album", start_date, end_date)
+    top_track = cube.top("track", start_date, end_date)
 
     overall_stats = {
         "Category": ["Top Artist", "Top Album", "Top Track"],
@@ -58,103 +134,89 @@ if df_created:
     st.table(overall_stats_df)
 
     st.write("### Platforms :desktop_computer: :iphone: :video_game: :tv:")
-    os_fig = px.histogram(df_date_filtered, x="platform")
+    platform_counts = cube.counts("platform", start_date, end_date).sort_index()
+    os_fig = px.bar(x=platform_counts.index, y=platform_counts.values, labels={"x": "platform", "y": "count"})
     st.plotly_chart(os_fig)
 
     st.write("## More charts")
     st.write("Below are charts that show the artists/albums/tracks that make up the top 25/50/75/100% of all the music listened to.")
-    # artist
-    st.write("### Artists :female-singer: 	:microphone:")
-    artist_filter = st.selectbox("Top %", [25, 50, 75, 100], index=3, key="artist_filter")
-    if artist_filter == 100:
-        artists_fig = px.histogram(df_date_filtered, x="master_metadata_album_artist_name")
-        st.plotly_chart(artists_fig)
-    else:
-        artist_listens_cumulative_df = df_date_filtered["master_metadata_album_artist_name"].value_counts().cumsum()
-        listen_count = artist_listens_cumulative_df.max() * (artist_filter/100)
-        filtered_artists = artist_listens_cumulative_df[artist_listens_cumulative_df < listen_count].index.values
-        filtered_df = df_date_filtered[df_date_filtered["master_metadata_album_artist_name"].isin(filtered_artists)]
-        artists_fig = px.histogram(filtered_df, x="master_metadata_album_artist_name")
-        st.plotly_chart(artists_fig)
-
-    # album
-    st.write("### Albums	:minidisc:")
-    album_filter = st.selectbox("Top %", [25, 50, 75, 100], index=3, key="album_filter")
-    if album_filter == 100:
-        album_fig = px.histogram(df_date_filtered, x="master_metadata_album_album_name")
-        st.plotly_chart(album_fig)
-    else:
-        album_listens_cumulative_df = df_date_filtered["master_metadata_album_album_name"].value_counts().cumsum()
-        listen_count = album_listens_cumulative_df.max() * (album_filter/100)
-        filtered_album = album_listens_cumulative_df[album_listens_cumulative_df < listen_count].index.values
-        filtered_df = df_date_filtered[df_date_filtered["master_metadata_album_album_name"].isin(filtered_album)]
-        album_fig = px.histogram(filtered_df, x="master_metadata_album_album_name")
-        st.plotly_chart(album_fig)
-
-    # track
-    st.write("### Tracks :musical_score:")
-    track_filter = st.selectbox("Top %", [25, 50, 75, 100], index=3, key="track_filter")
-    if track_filter == 100:
-        track_fig = px.histogram(df_date_filtered, x="master_metadata_track_name")
-        st.plotly_chart(track_fig)
-    else:
-        track_listens_cumulative_df = df_date_filtered["master_metadata_track_name"].value_counts().cumsum()
-        listen_count = track_listens_cumulative_df.max() * (track_filter/100)
-        filtered_track = track_listens_cumulative_df[track_listens_cumulative_df < listen_count].index.values
-        filtered_df = df_date_filtered[df_date_filtered["master_metadata_track_name"].isin(filtered_track)]
-        track_fig = px.histogram(filtered_df, x="master_metadata_track_name")
-        st.plotly_chart(track_fig)
+    pareto_chart("### Artists :female-singer: 	:microphone:", cube.ranking("artist", start_date, end_date),
+                 "artist_filter", "master_metadata_album_artist_name")
+    pareto_chart("### Albums	:minidisc:", cube.ranking("album", start_date, end_date),
+                 "album_filter", "master_metadata_album_album_name")
+    pareto_chart("### Tracks :musical_score:", cube.ranking("track", start_date, end_date),
+                 "track_filter", "master_metadata_track_name")
 
     # countries
     st.write("### Countries :world_map:")
     st.write("Unfortunately I can't find the code to country name so I can't convert to countries and the plot them on a map.")
-    st.dataframe(df_date_filtered["conn_country"].unique())
+    st.dataframe(cube.counts("country", start_date, end_date).index.to_series(index=None, name="conn_country"))
 
     # listening stats
     st.write("### Time :stopwatch: :hourglass_flowing_sand:")
 
     # most popular hour of the day
-    hours_df = df_date_filtered.groupby(["hour"])
-    songs_per_hour_df = hours_df["hour"].value_counts().to_frame()
-    songs_per_hour_df.reset_index(inplace=True)
+    songs_per_hour_df = cube.plays_per_hour(start_date, end_date)
     songs_per_hour_fig = px.bar(songs_per_hour_df, x="hour", y="count", title="Total number of songs played each hour across listening history")
     st.plotly_chart(songs_per_hour_fig)
 
     # hours per day
-    days_df = df_date_filtered.groupby(["dayname"])
-    hours_per_day_df = days_df["ms_played"].sum().to_frame()
-    hours_per_day_df.reset_index(inplace=True)
-    hours_per_day_df["hours"] = hours_per_day_df["ms_played"]/3600000
+    hours_per_day_df = cube.hours_per_day_name(start_date, end_date)
     hours_per_day_fig = px.bar(hours_per_day_df, x="dayname", y="hours",
-                               category_orders={"dayname": ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]},
+                               category_orders={"dayname": DAY_NAMES},
                                title="Time in hours listened per day across entire listening history")
     st.plotly_chart(hours_per_day_fig)
 
     # monthly listening time
-    months_df = df_date_filtered.groupby(["month"])
-    songs_per_month_df = months_df["month"].value_counts().to_frame()
-    songs_per_month_df.reset_index(inplace=True)
+    songs_per_month_df = cube.plays_per_month(start_date, end_date)
     songs_per_month_fig = px.bar(songs_per_month_df, x="month", y="count",
-                                 category_orders={"month": ["January", "February", "March", "April", "May", "June",
-                                                            "July", "August", "September", "October", "November", "December"]},
+                                 category_orders={"month": MONTH_NAMES},
                                  title="Total number of songs played each month across listening history")
     st.plotly_chart(songs_per_month_fig)
 
+    # listening sessions
+    st.write("### Listening Sessions :headphones:")
+    idle_minutes = st.slider("Minutes of silence that end a session", 5, 120, 30, step=5)
+    sessions = sessionizer.sessions(pd.Timedelta(minutes=idle_minutes))
+    # Sessions come out sorted by start, so the date range is two binary searches rather than a per-row date comparison
+    session_starts = sessions["start"].to_numpy()
+    bounds = [pd.Timestamp(start_date), pd.Timestamp(end_date) + pd.Timedelta(days=1)]
+    first, last = np.searchsorted(session_starts, np.array(bounds, dtype="datetime64[ns]").astype(session_starts.dtype))
+    sessions = sessions.iloc[first:last]
+    if len(sessions):
+        st.write(f"{len(sessions):,} sessions, median {sessions['duration_minutes'].median():.0f} minutes and "
+                 f"{sessions['tracks'].median():.0f} tracks, {sessions['skips'].sum() / max(sessions['tracks'].sum(), 1):.0%} of tracks skipped")
+    else:
+        st.write("No listening sessions in this date range")
+    session_length_fig = px.bar(session_length_distribution(sessions), x="minutes", y="sessions",
+                                title="Number of listening sessions by length in minutes")
+    st.plotly_chart(session_length_fig)
+    session_hour_fig = px.bar(sessions_by_hour(sessions), x="hour", y="sessions", title="Number of listening sessions started each hour")
+    st.plotly_chart(session_hour_fig)
+
     # discovery history
     st.write("### Discovery History :mag:")
-    discovery_df = df_date_filtered.sort_values(by="datetime")
-    discovery_df.drop_duplicates(subset=["master_metadata_track_name"], keep="first", inplace=True)
-    discovery_df["type"] = "Discovered"
-    discovery_fig = px.histogram(discovery_df, x="datetime", title="Discovery history of songs")
+    discovery_df = cube.discoveries_per_day(start_date, end_date)
+    # Days are re-binned server-side to weeks/months for long histories, so only a bounded number of bars is sent
+    resolution, discovery_bins = time_histogram(discovery_df["date"], {column: discovery_df[column] for column in ["Discovered", "Repeated"]})
+    discovery_fig = histogram_figure(discovery_bins, ["Discovered"], resolution, title=f"Discovery history of songs (per {resolution})")
     st.plotly_chart(discovery_fig)
 
-    repeated_df = pd.merge(df_date_filtered, discovery_df, how="outer", indicator=True)
-    repeated_df = repeated_df[repeated_df._merge == "left_only"]
-    repeated_df["type"] = "Repeated"
-    combined_df = pd.concat([discovery_df, repeated_df])
-    combined_discovery_fig = px.histogram(combined_df, x="datetime", color="type", title="Comparison to total songs listened to")
+    combined_discovery_fig = histogram_figure(discovery_bins, ["Discovered", "Repeated"], resolution,
+                                              title=f"Comparison to total songs listened to (per {resolution})")
     st.plotly_chart(combined_discovery_fig)
 
+    # ad-hoc questions
+    with st.expander("Ask your own question with SQL :mag_right:"):
+        st.write("Your plays are in a table called `plays`, with columns such as `Datetime`, `Artist`, `Song name`, "
+                 "`Milliseconds played`, `Platform` and `Country`.")
+        query = st.text_area("SQL", DEFAULT_SQL, height=150)
+        if st.button("Run query"):
+            try:
+                st.dataframe(listening_sql(st.session_state["dataset_key"], df).query(query))
+            except duckdb.Error as error:
+                st.error(str(error))
+
 
 equaliser_animation = load_lottiefile("animations/equaliser.json")
 st_lottie(equaliser_animation)
@@ -0,0 +1,100 @@
+import io
+import json
+
+import pandas as pd
+
+
+BLOCK_SIZE = 1 << 20
+DEFAULT_CHUNKSIZE = 50_000
+_WHITESPACE = " \t\r\n"
+
+
+def _open_text(json_file):
+    # Returns a text stream and whether it was opened here (and so should be closed here)
+    if isinstance(json_file, (str, bytes)) or hasattr(json_file, "__fspath__"):
+        return open(json_file, encoding="utf-8"), True
+    if isinstance(json_file, io.TextIOBase):
+        return json_file, False
+    # Binary file-like objects (e.g. Streamlit uploads) are decoded on the fly
+    return io.TextIOWrapper(json_file, encoding="utf-8"), False
+
+
+def iter_records(json_file, columns: list = None):
+    # Incrementally decode a top-level JSON array, holding at most one block of text plus one record in memory
+    decoder = json.JSONDecoder()
+    f, owned = _open_text(json_file)
+    try:
+        buffer = ""
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buffer):
+                char = buffer[pos]
+                if not started:
+                    if char != "[":
+                        raise ValueError(f"Expected a JSON array, found {char!r}")
+                    started = True
+                    pos += 1
+                    continue
+                if char == ",":
+                    pos += 1
+                    continue
+                if char == "]":
+                    return
+                try:
+                    record, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    pos = end
+                    if columns is not None:
+                        record = {column: record.get(column) for column in columns}
+                    yield record
+                    continue
+            elif eof:
+                if started:
+                    raise ValueError("Unterminated JSON array")
+                return
+
+            # Need more text: drop what has been consumed and read the next block
+            block = f.read(BLOCK_SIZE)
+            eof = not block
+            buffer = buffer[pos:] + block
+            pos = 0
+    finally:
+        if owned:
+            f.close()
+        elif f is not json_file:
+            # Leave the caller's binary stream open
+            f.detach()
+
+
+def iter_chunks(json_files, columns: list, chunksize: int = DEFAULT_CHUNKSIZE):
+    # Yields DataFrames of at most `chunksize` rows holding only `columns`, across one or many files
+    if not isinstance(json_files, (list, tuple)):
+        json_files = [json_files]
+    records = []
+    for json_file in json_files:
+        for record in iter_records(json_file, columns):
+            records.append(record)
+            if len(records) >= chunksize:
+                yield pd.DataFrame.from_records(records, columns=columns)
+                records = []
+    if records:
+        yield pd.DataFrame.from_records(records, columns=columns)
+
+
+def read_json_chunked(json_files, columns: list, chunksize: int = DEFAULT_CHUNKSIZE, transform=None) -> pd.DataFrame:
+    chunks = iter_chunks(json_files, columns, chunksize)
+    if transform is not None:
+        chunks = map(transform, chunks)
+    frames = list(chunks)
+    if not frames:
+        # An empty history still goes through transform, so callers always get the transformed columns
+        empty = pd.DataFrame(columns=columns)
+        return empty if transform is None else transform(empty)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from timestamps import naive_datetimes
+
+
+class TimeIndex:
+    # Keeps a frame sorted by timestamp so any time range is a contiguous block found by binary search.
+    # Slices are positional (iloc), so they share memory with the sorted frame rather than copying rows.
+    def __init__(self, df: pd.DataFrame, datetime_column: str, presorted: bool = False):
+        if not presorted and not df[datetime_column].is_monotonic_increasing:
+            df = df.sort_values(datetime_column, kind="stable", ignore_index=True)
+        self.df = df
+        self.datetime_column = datetime_column
+        self._times = naive_datetimes(df[datetime_column]).to_numpy()
+
+    def __len__(self):
+        return len(self._times)
+
+    def _position(self, timestamp, side: str = "left") -> int:
+        return int(np.searchsorted(self._times, np.datetime64(pd.Timestamp(timestamp)).astype(self._times.dtype), side))
+
+    def positions(self, start=None, end=None) -> tuple:
+        # Half-open [start, end) in timestamps, as (lo, hi) row positions
+        lo = 0 if start is None else self._position(start)
+        hi = len(self._times) if end is None else self._position(end)
+        return lo, max(lo, hi)
+
+    def between(self, start=None, end=None) -> pd.DataFrame:
+        lo, hi = self.positions(start, end)
+        return self.df.iloc[lo:hi]
+
+    def slice(self, start_date=None, end_date=None) -> pd.DataFrame:
+        # Inclusive calendar dates, as returned by st.date_input
+        end = None if end_date is None else pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+        start = None if start_date is None else pd.Timestamp(start_date).normalize()
+        return self.between(start, end)
+
+    def month(self, year: int, month: int) -> pd.DataFrame:
+        start = pd.Timestamp(year=year, month=month, day=1)
+        return self.between(start, start + pd.offsets.MonthBegin(1))
+
+    def year(self, year: int) -> pd.DataFrame:
+        return self.between(pd.Timestamp(year=year, month=1, day=1), pd.Timestamp(year=year + 1, month=1, day=1))
+
+    def rolling(self, end, window) -> pd.DataFrame:
+        # The `window` (Timedelta or anything it accepts, e.g. "30D") leading up to `end`
+        end = pd.Timestamp(end)
+        return self.between(end - pd.Timedelta(window), end)
+
+    def bounds(self) -> tuple:
+        if not len(self._times):
+            return None, None
+        return pd.Timestamp(self._times[0]), pd.Timestamp(self._times[-1])
@@ -0,0 +1,64 @@
+import io
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context
+
+import pandas as pd
+
+from spotify_parser import SpotifyParser
+from streaming_json import read_json_chunked
+
+
+def _parse_file(name: str, data: bytes, columns: list):
+    start = time.perf_counter()
+    df = read_json_chunked(io.BytesIO(data), columns)
+    timing = {
+        "File": name,
+        "Megabytes": len(data) / 1e6,
+        "Rows": len(df),
+        "Seconds": time.perf_counter() - start
+    }
+    return df, timing
+
+
+@contextmanager
+def _main_path_hidden():
+    # Spawned workers re-run the main script from __main__.__file__ before unpickling anything. Under Streamlit that
+    # script is the whole dashboard, while the workers only need this module, so its path is hidden as they start.
+    main = sys.modules["__main__"]
+    main_path = main.__dict__.pop("__file__", None)
+    try:
+        yield
+    finally:
+        if main_path is not None:
+            main.__file__ = main_path
+
+
+def ingest_uploads(uploaded_files, columns: list = None, executor: str = "process", max_workers: int = None):
+    # Parse every upload in parallel, pruned to `columns`, and concatenate once at the end
+    columns = columns or SpotifyParser.REQUIRED_COLUMNS
+    files = [(f.name, f.getvalue()) for f in uploaded_files]
+    if not files:
+        return pd.DataFrame(columns=columns), pd.DataFrame(columns=["File", "Megabytes", "Rows", "Seconds"])
+
+    max_workers = max_workers or min(len(files), os.cpu_count() or 1)
+    if executor == "process":
+        # Spawned rather than forked: forking copies the multi-threaded Streamlit server, locks and all
+        pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn"))
+    else:
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+    start = time.perf_counter()
+    with pool:
+        # map submits every file, and so starts every worker, before returning
+        with _main_path_hidden():
+            results = pool.map(_parse_file, *zip(*files), [columns] * len(files))
+        results = list(results)
+
+    df = pd.concat([frame for frame, _ in results], ignore_index=True)
+    timings = pd.DataFrame([timing for _, timing in results])
+    timings.loc[len(timings)] = ["Total", timings["Megabytes"].sum(), len(df), time.perf_counter() - start]
+    return df, timings